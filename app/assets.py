@@ -0,0 +1,52 @@
+import hashlib
+import os
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+from starlette.staticfiles import StaticFiles
+
+STATIC_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "static")
+TEMPLATES_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "templates")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+@lru_cache(maxsize=None)
+def file_hash(path: str) -> str:
+    """Hash curto do conteúdo de um arquivo de static/ (calculado uma vez por worker)."""
+    with open(os.path.join(STATIC_DIR, path), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def static_url(path: str) -> str:
+    """URL versionada pelo conteúdo: muda sozinha quando o arquivo muda no deploy."""
+    path = path.lstrip("/")
+    return f"/static/{path}?v={file_hash(path)}"
+
+
+@lru_cache(maxsize=None)
+def build_id() -> str:
+    """Hash de templates + static: entra no ETag das páginas para um deploy novo não devolver 304 velho."""
+    h = hashlib.sha256()
+    for root in (TEMPLATES_DIR, STATIC_DIR):
+        for dirpath, _, names in sorted(os.walk(root)):
+            for name in sorted(names):
+                if name.startswith("precache-manifest"): continue  # gerado a partir deste hash
+                with open(os.path.join(dirpath, name), "rb") as f: h.update(f.read())
+    return h.hexdigest()[:12]
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles que marca como imutável o que vem com ?v=<hash> (gerado por static_url).
+
+    Só vale se o hash for o do arquivo atual: um ?v= antigo (de uma página em cache de
+    antes do deploy) recebe no-cache, senão os bytes novos ficariam presos um ano nele.
+    """
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            version = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [""])[0]
+            current = version and version == file_hash(path.replace(os.sep, "/"))
+            response.headers["Cache-Control"] = IMMUTABLE if current else "no-cache"
+        return response
@@ -0,0 +1,227 @@
+"""Exportação/importação do diário de um casal (zip com um NDJSON por tabela).
+
+    entries.ndjson, special_dates.ndjson, notifications.ndjson, [users.ndjson], manifest.json
+
+A exportação lê com yield_per e vai devolvendo o zip em pedaços, então a memória
+não cresce com o tamanho do diário. A importação valida o arquivo inteiro numa
+primeira passada (sem gravar nada) e depois insere em lotes com executemany; no
+fim refaz tags, resumos e índice de busca do casal.
+Linhas de notifications que são eventos do /events (entry_saved/entry_deleted)
+ficam de fora: eram do deploy de origem e não fazem sentido repostas aqui.
+
+`users.ndjson` (com o hash da senha) só entra pelo CLI (`python -m app.manage
+export --with-users`), para mudar um casal de deploy (SQLite <-> Postgres).
+"""
+import io
+import json
+import re
+import secrets
+import zipfile
+from datetime import date, datetime, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .models import Couple, User, Entry, EntryTag, DaySummary, SpecialDate, Notification, split_tags
+from . import summaries, search, events
+
+FORMAT_VERSION = 1
+EXPORT_BATCH = 1000
+IMPORT_BATCH = 1000
+DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class InvalidArchive(ValueError):
+    """Arquivo de importação inválido; `errors` traz até 20 problemas com a linha."""
+
+    def __init__(self, errors: list[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+# Colunas exportadas por tabela (id e couple_id ficam de fora: mudam no destino)
+def _string(n): return lambda v: isinstance(v, str) and len(v) <= n
+def _text(v): return isinstance(v, str)
+def _day(v):
+    # Regex + data de verdade: "2024-13-45" derrubaria a timeline (strptime) em todo request
+    if not (isinstance(v, str) and DAY_RE.match(v)): return False
+    try: date.fromisoformat(v); return True
+    except ValueError: return False
+def _opt_iso(parse):
+    def check(v):
+        if v is None: return True
+        try: parse(v); return True
+        except (TypeError, ValueError): return False
+    return check
+
+TABLES = {
+    "entries": (Entry, {
+        "day": _day, "author": lambda v: v in ("me", "par"), "mood": _string(120), "moment_special": _text,
+        "love_action": _text, "character": _string(200), "music": _string(200), "updated_at": _string(32),
+        "tags_csv": _text, "day_date": _opt_iso(date.fromisoformat), "created_at": _opt_iso(datetime.fromisoformat),
+    }, ("day", "author")),
+    "special_dates": (SpecialDate, {
+        "type": _string(50), "label": _string(80), "date": _string(10), "note": _text,
+    }, ("type", "label", "date")),
+    "notifications": (Notification, {
+        "created_at": _string(20), "title": _string(120), "body": _text,
+    }, ("created_at", "title")),
+}
+NULLABLE = ("day_date", "created_at")
+USER_FIELDS = {"name": _string(80), "email": _string(160), "password_hash": _string(255)}
+
+
+# =====================================================
+# EXPORTAÇÃO
+# =====================================================
+class _Chunks(io.RawIOBase):
+    """Destino não-seekable do ZipFile: acumula bytes até o gerador levar."""
+
+    def __init__(self): self.parts = []
+    def writable(self): return True
+    def write(self, b): self.parts.append(bytes(b)); return len(b)
+    def take(self) -> bytes:
+        data = b"".join(self.parts); self.parts = []
+        return data
+
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _rows(db: Session, model, columns, couple_id: int):
+    q = db.query(*(getattr(model, c) for c in columns)).filter(model.couple_id == couple_id).order_by(model.id)
+    for row in q.yield_per(EXPORT_BATCH):
+        yield {c: _jsonable(v) for c, v in zip(columns, row)}
+
+
+def export_couple(couple_id: int, with_users: bool = False, batch_size: int = EXPORT_BATCH):
+    """Gerador de bytes do zip. Abre a própria sessão: serve para StreamingResponse e para o CLI."""
+    out = _Chunks()
+    counts = {}
+    with SessionLocal() as db:
+        couple = db.get(Couple, couple_id)
+        if couple is None: raise ValueError(f"casal {couple_id} não existe")
+        with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for name, (model, fields, _) in TABLES.items():
+                counts[name] = 0
+                with zf.open(f"{name}.ndjson", "w", force_zip64=True) as f:
+                    for row in _rows(db, model, list(fields), couple_id):
+                        f.write(json.dumps(row, ensure_ascii=False).encode() + b"\n")
+                        counts[name] += 1
+                        if counts[name] % batch_size == 0: yield out.take()
+                yield out.take()
+            if with_users:
+                users = [{c: getattr(u, c) for c in USER_FIELDS} for u in db.query(User).filter(User.couple_id == couple_id).order_by(User.id)]
+                zf.writestr("users.ndjson", "".join(json.dumps(u, ensure_ascii=False) + "\n" for u in users))
+                counts["users"] = len(users)
+            zf.writestr("manifest.json", json.dumps({
+                "format": FORMAT_VERSION, "couple_code": couple.code, "counts": counts,
+                "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }, indent=2))
+        yield out.take()
+
+
+# =====================================================
+# IMPORTAÇÃO
+# =====================================================
+def _lines(zf: zipfile.ZipFile, name: str):
+    if name not in zf.namelist(): return
+    with zf.open(name) as f:
+        for lineno, raw in enumerate(f, 1):
+            if raw.strip(): yield lineno, raw
+
+
+def _validate_row(raw: bytes, fields: dict, required: tuple) -> tuple[dict | None, str | None]:
+    try: row = json.loads(raw)
+    except ValueError: return None, "JSON inválido"
+    if not isinstance(row, dict): return None, "esperado um objeto"
+    missing = [f for f in required if f not in row]
+    if missing: return None, f"faltando {', '.join(missing)}"
+    bad = [f for f, check in fields.items() if f in row and not check(row[f])]
+    if bad: return None, f"valor inválido em {', '.join(bad)}"
+    # Todas as colunas em toda linha: o executemany usa as chaves da primeira
+    return {f: row.get(f, None if f in NULLABLE else "") for f in fields}, None
+
+
+def validate_archive(zf: zipfile.ZipFile) -> dict:
+    """Primeira passada: confere tudo sem gravar. Devolve o manifest ou levanta InvalidArchive."""
+    errors = []
+    try: manifest = json.loads(zf.read("manifest.json"))
+    except (KeyError, ValueError): raise InvalidArchive(["manifest.json ausente ou inválido"])
+    if manifest.get("format") != FORMAT_VERSION: raise InvalidArchive([f"formato {manifest.get('format')} não suportado"])
+    sources = {**{n: (fields, req) for n, (_, fields, req) in TABLES.items()}, "users": (USER_FIELDS, tuple(USER_FIELDS))}
+    for name, (fields, required) in sources.items():
+        for lineno, raw in _lines(zf, f"{name}.ndjson"):
+            _, err = _validate_row(raw, fields, required)
+            if err: errors.append(f"{name}.ndjson:{lineno}: {err}")
+            if len(errors) >= 20: raise InvalidArchive(errors)
+    if errors: raise InvalidArchive(errors)
+    return manifest
+
+
+def _parse_types(row: dict) -> dict:
+    # day_date sai do próprio day (já validado), não do campo separado do arquivo
+    if "day" in row: row["day_date"] = date.fromisoformat(row["day"])
+    if row.get("created_at"): row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return row
+
+
+def _insert_rows(db: Session, model, batch: list[dict]) -> int:
+    db.execute(insert(model), batch)  # lista de parâmetros = executemany
+    return len(batch)
+
+
+def _insert_entries(db: Session, couple_id: int, batch: list[dict]) -> int:
+    ids = db.execute(insert(Entry).returning(Entry.id, sort_by_parameter_order=True), batch).scalars().all()
+    tags = [{"entry_id": eid, "couple_id": couple_id, "tag": t} for eid, row in zip(ids, batch) for t in split_tags(row.get("tags_csv"))]
+    if tags: db.execute(insert(EntryTag), tags)
+    return len(ids)
+
+
+def _create_couple(db: Session, zf: zipfile.ZipFile, code: str | None) -> int:
+    """Casal novo (mantém o código se estiver livre) com os usuários do arquivo."""
+    if not code or db.query(Couple.id).filter(Couple.code == code).first(): code = secrets.token_hex(4)
+    couple = Couple(code=code)
+    db.add(couple); db.flush()
+    for _, raw in _lines(zf, "users.ndjson"):
+        user, _ = _validate_row(raw, USER_FIELDS, tuple(USER_FIELDS))
+        user["email"] = user["email"].strip().lower()
+        if db.query(User.id).filter(User.email == user["email"]).first():
+            raise InvalidArchive([f"já existe usuário com o e-mail {user['email']}"])
+        db.add(User(couple_id=couple.id, **user))
+    return couple.id
+
+
+def import_couple(db: Session, fileobj, couple_id: int | None = None, replace: bool = False, batch_size: int = IMPORT_BATCH) -> dict:
+    """Importa o zip para `couple_id` (ou um casal novo, com os usuários do arquivo).
+
+    `replace` apaga antes o diário atual do casal. Tudo numa transação: se algo
+    falhar no meio, nada fica gravado. Devolve {"couple_id", "entries", ...}.
+    """
+    with zipfile.ZipFile(fileobj) as zf:
+        manifest = validate_archive(zf)
+        if couple_id is None: couple_id = _create_couple(db, zf, manifest.get("couple_code"))
+        elif replace:
+            search.unindex_couple(db, couple_id)  # antes das entradas, senão sobram linhas órfãs no índice
+            for model in (EntryTag, DaySummary, Entry, SpecialDate, Notification):
+                db.query(model).filter(model.couple_id == couple_id).delete(synchronize_session=False)
+
+        result = {"couple_id": couple_id}
+        for name, (model, fields, required) in TABLES.items():
+            batch, done = [], 0
+            flush = (lambda rows: _insert_entries(db, couple_id, rows)) if model is Entry else (lambda rows, m=model: _insert_rows(db, m, rows))
+            for _, raw in _lines(zf, f"{name}.ndjson"):
+                row, _ = _validate_row(raw, fields, required)
+                # Eventos do /events de outro deploy (com ids de usuário de lá) não são repostos aqui
+                if model is Notification and row["title"] in events.KINDS: continue
+                batch.append({**_parse_types(row), "couple_id": couple_id})
+                if len(batch) >= batch_size: done += flush(batch); batch = []
+            if batch: done += flush(batch)
+            result[name] = done
+    db.commit()
+    # Derivados: recalculados a partir do que entrou (cada um commita o seu)
+    summaries.rebuild_summaries(db, couple_id=couple_id)
+    search.rebuild_search(db, couple_id=couple_id)
+    return result
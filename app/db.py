@@ -1,6 +1,11 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
+
+from .perf import instrument_engine
 
 # Pega a URL do banco do Render (Postgres) ou usa um arquivo local (SQLite)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./duo.db")
@@ -9,23 +14,168 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./duo.db")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+def _env_int(name: str, default: int) -> int: return int(os.getenv(name, str(default)))
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, "1" if default else "0").strip().lower() in ("1", "true", "yes")
+
+# Presets por banco; qualquer um pode ser sobrescrito por variável de ambiente
+POOL_PRESETS = {
+    "postgresql": {"pool_size": 5, "max_overflow": 10, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": True},
+    "sqlite": {"pool_size": 5, "max_overflow": 10, "pool_timeout": 30, "pool_recycle": -1, "pool_pre_ping": False},
+}
+
+# SQLite: WAL deixa leitores e um escritor trabalharem juntos e o busy_timeout faz o
+# segundo escritor esperar em vez de estourar "database is locked"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+# Postgres: derruba consultas presas em vez de segurar a conexão para sempre (0 = sem limite)
+PG_STATEMENT_TIMEOUT_MS = _env_int("PG_STATEMENT_TIMEOUT_MS", 15000)
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """kwargs do create_engine/create_async_engine: pool + connect_args do backend."""
+    if url.startswith("sqlite"):
+        # Banco em memória usa pool próprio (uma conexão só), então sem opções de pool
+        if ":memory:" in url or url.rstrip("/") in ("sqlite:", "sqlite+aiosqlite:"): return {}
+        preset = POOL_PRESETS["sqlite"]
+        connect_args = {} if is_async else {"check_same_thread": False}
+    else:
+        preset = POOL_PRESETS["postgresql"]
+        connect_args = {}
+        if PG_STATEMENT_TIMEOUT_MS:
+            if is_async: connect_args = {"server_settings": {"statement_timeout": str(PG_STATEMENT_TIMEOUT_MS)}}
+            else: connect_args = {"options": f"-c statement_timeout={PG_STATEMENT_TIMEOUT_MS}"}
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", preset["pool_size"]),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", preset["max_overflow"]),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", preset["pool_timeout"]),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", preset["pool_recycle"]),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", preset["pool_pre_ping"]),
+        "connect_args": connect_args,
+    }
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cur.close()
+
+class PoolMetrics:
+    """Contadores do pool alimentados pelos eventos do SQLAlchemy (leitura via pool_stats()).
+
+    `waits`/`wait_seconds`: checkouts que começaram com todas as vagas ocupadas (pool_size +
+    max_overflow) e, portanto, esperaram alguém devolver uma conexão, e o tempo somado dessas
+    esperas. Medido em volta do pool.connect(), que é onde o request fica bloqueado.
+    """
+
+    def __init__(self, pool, limit: int | None = None):
+        self.pool = pool
+        self.limit = limit  # pool_size + max_overflow (None = pool sem limite)
+        self.counts = {"connects": 0, "checkouts": 0, "checkins": 0, "overflow_checkouts": 0, "last_slot_checkouts": 0,
+                       "invalidations": 0, "waits": 0, "wait_seconds": 0.0}
+        self._lock = threading.Lock()
+        event.listen(pool, "connect", lambda *a: self._bump("connects"))
+        event.listen(pool, "checkin", lambda *a: self._bump("checkins"))
+        event.listen(pool, "invalidate", lambda *a: self._bump("invalidations"))
+        event.listen(pool, "checkout", self._on_checkout)
+        if limit and hasattr(pool, "checkedout"):
+            self._connect = pool.connect
+            pool.connect = self._timed_connect  # o Engine pega conexão sempre por pool.connect()
+
+    def _bump(self, key: str, value=1):
+        with self._lock: self.counts[key] += value
+
+    def _on_checkout(self, *_):
+        self._bump("checkouts")
+        # overflow > 0: já passou do pool_size; last_slot: este checkout ocupou a última vaga
+        if getattr(self.pool, "overflow", lambda: 0)() > 0: self._bump("overflow_checkouts")
+        if self.limit and self.pool.checkedout() >= self.limit: self._bump("last_slot_checkouts")
+
+    def _timed_connect(self):
+        if self.pool.checkedout() < self.limit: return self._connect()
+        t0 = time.perf_counter()
+        try: return self._connect()
+        finally:
+            # Conta também quem desistiu no pool_timeout: esperou do mesmo jeito
+            with self._lock:
+                self.counts["waits"] += 1
+                self.counts["wait_seconds"] += time.perf_counter() - t0
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        live = {"pool": type(pool).__name__}
+        if hasattr(pool, "checkedout"):
+            live.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(), overflow=pool.overflow())
+        with self._lock: return {**live, **self.counts}
+
+def tune_engine(sync_engine, options: dict) -> PoolMetrics:
+    if sync_engine.dialect.name == "sqlite": event.listen(sync_engine, "connect", _sqlite_pragmas)
+    instrument_engine(sync_engine)
+    limit = options["pool_size"] + max(options["max_overflow"], 0) if "pool_size" in options else None
+    return PoolMetrics(sync_engine.pool, limit)
+
 # Cria o motor de conexão
-# Se for SQLite, precisa de um argumento extra. Se for Postgres, não.
-connect_args = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+_engine_options = engine_options(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_engine_options)
+_pool_metrics = {"sync": tune_engine(engine, _engine_options)}
+
+# expire_on_commit=False: run_db encerra a transação a cada passo e os objetos continuam legíveis
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# Modo async (opcional): DB_ASYNC=1 usa asyncpg/aiosqlite e as rotas não prendem
+# um worker do threadpool enquanto esperam o banco. O engine síncrono acima continua
+# existindo para o create_all, as migrações e os comandos do app.manage.
+DB_ASYNC = os.getenv("DB_ASYNC", "").strip().lower() in ("1", "true", "yes")
 
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args=connect_args
-)
+def async_database_url(url: str) -> str:
+    if url.startswith("sqlite:"): return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"): return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    _async_engine_options = engine_options(DATABASE_URL, is_async=True)
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), **_async_engine_options)
+    _pool_metrics["async"] = tune_engine(async_engine.sync_engine, _async_engine_options)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
+def pool_stats() -> dict:
+    """Estado atual dos pools (em uso, overflow, checkouts...) de cada engine."""
+    return {name: m.snapshot() for name, m in _pool_metrics.items()}
+
 # Função para obter o banco de dados em cada requisição
-def get_db():
-    db = SessionLocal()
+if DB_ASYNC:
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+else:
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+def _unit_of_work(db, fn, *args, **kwargs):
     try:
-        yield db
-    finally:
-        db.close()
+        result = fn(db, *args, **kwargs)
+        # Fecha a transação para a conexão voltar ao pool entre um passo e outro da rota;
+        # senão requests esperando vaga no threadpool seguram conexões e travam o pool.
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+
+async def run_db(db, fn, *args, **kwargs):
+    """Roda `fn(session, *args)` (código ORM síncrono) a partir de uma rota async.
+
+    No modo async vai pelo `run_sync` da AsyncSession (greenlet, sem thread); no modo
+    síncrono cai no threadpool, como as rotas `def` faziam antes.
+    """
+    if DB_ASYNC: return await db.run_sync(_unit_of_work, fn, *args, **kwargs)
+    return await run_in_threadpool(_unit_of_work, db, fn, *args, **kwargs)
@@ -0,0 +1,170 @@
+"""Eventos ao vivo do casal, servidos por SSE em /events.
+
+Cada escrita no diário grava uma linha em `notifications` (o id dela é o id do
+evento, usado pelo Last-Event-ID para repor o que o cliente perdeu) e avisa os
+inscritos do casal:
+  - EVENTS_BACKEND=memory (padrão): fan-out no próprio processo, serve para um worker;
+  - EVENTS_BACKEND=postgres: NOTIFY na mesma transação da escrita e um LISTEN por
+    worker repassando para os inscritos locais, sem polling.
+
+Conexão parada não segura conexão do banco nem thread: é só uma fila asyncio.
+"""
+import asyncio
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .db import DATABASE_URL
+from .models import Notification
+
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory").strip().lower()
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_REPLAY_LIMIT = int(os.getenv("EVENTS_REPLAY_LIMIT", "200"))
+RETRY_MS = 5000
+PG_CHANNEL = "duo_events"
+KINDS = ("entry_saved", "entry_deleted")
+
+
+class EventBroker:
+    """Inscritos por casal; cada conexão SSE é uma asyncio.Queue limitada."""
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subs = {}  # couple_id -> set[Queue]
+
+    def subscribe(self, couple_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self._subs.setdefault(couple_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, couple_id: int, queue: asyncio.Queue):
+        subs = self._subs.get(couple_id)
+        if subs is None: return
+        subs.discard(queue)
+        if not subs: del self._subs[couple_id]
+
+    def dispatch(self, event: dict):
+        for queue in list(self._subs.get(event["couple_id"], ())):
+            try: queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Cliente lento: derruba a conexão; ele volta com Last-Event-ID e repõe pelo banco
+                while not queue.empty(): queue.get_nowait()
+                queue.put_nowait(None)
+                self.unsubscribe(event["couple_id"], queue)
+
+    def count(self) -> int: return sum(len(s) for s in self._subs.values())
+
+
+broker = EventBroker()
+
+
+# =====================================================
+# GRAVAÇÃO (síncrona, dentro da transação da escrita)
+# =====================================================
+def _as_event(n: Notification) -> dict:
+    return {"id": n.id, "couple_id": n.couple_id, "type": n.title, **json.loads(n.body or "{}")}
+
+
+def record_event(db: Session, couple_id: int, kind: str, day: str, by: int) -> dict:
+    n = Notification(couple_id=couple_id, title=kind, body=json.dumps({"day": day, "by": by}),
+                     created_at=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"))
+    db.add(n); db.flush()
+    event = _as_event(n)
+    if EVENTS_BACKEND == "postgres":
+        # Entregue só no commit (e descartado no rollback), como a própria linha
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": PG_CHANNEL, "payload": json.dumps(event)})
+    return event
+
+
+def publish(event: dict | None):
+    """Chamar depois do commit. No modo postgres quem entrega é o LISTEN."""
+    if event and EVENTS_BACKEND == "memory": broker.dispatch(event)
+
+
+def events_after(db: Session, couple_id: int, last_id: int) -> list[dict]:
+    rows = (
+        db.query(Notification)
+        .filter(Notification.couple_id == couple_id, Notification.id > last_id, Notification.title.in_(KINDS))
+        .order_by(Notification.id).limit(EVENTS_REPLAY_LIMIT).all()
+    )
+    return [_as_event(n) for n in rows]
+
+
+def sweep_events(db: Session, keep_days: int = 30, batch_size: int = 1000) -> int:
+    """Apaga eventos mais velhos que `keep_days`, em lotes. Devolve quantos saíram."""
+    cutoff = datetime.fromtimestamp(datetime.now(timezone.utc).timestamp() - keep_days * 86400, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    removed = 0
+    while True:
+        ids = [i for (i,) in db.query(Notification.id).filter(Notification.title.in_(KINDS), Notification.created_at < cutoff).limit(batch_size)]
+        if not ids: break
+        db.query(Notification).filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        removed += len(ids)
+    return removed
+
+
+# =====================================================
+# STREAM
+# =====================================================
+def _sse(event: dict) -> str:
+    data = {k: v for k, v in event.items() if k != "couple_id"}
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream(couple_id: int, queue: asyncio.Queue, replay: list[dict], last_id: int):
+    """Corpo do /events: repõe o que faltou, depois eventos ao vivo e um ping a cada EVENTS_HEARTBEAT."""
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for event in replay:
+            last_id = event["id"]
+            yield _sse(event)
+        while True:
+            try: event = await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event is None: return
+            if event["id"] <= last_id: continue  # já foi na reposição
+            last_id = event["id"]
+            yield _sse(event)
+    finally:
+        broker.unsubscribe(couple_id, queue)
+
+
+# =====================================================
+# POSTGRES LISTEN/NOTIFY
+# =====================================================
+_listener_task = None
+
+
+async def _pg_listen():
+    import asyncpg
+    dsn = re.sub(r"^postgresql\+\w+://", "postgresql://", DATABASE_URL)
+    on_notify = lambda conn, pid, channel, payload: broker.dispatch(json.loads(payload))
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn)
+            await conn.add_listener(PG_CHANNEL, on_notify)
+            while not conn.is_closed(): await asyncio.sleep(EVENTS_HEARTBEAT)
+        except (OSError, asyncpg.PostgresError):
+            pass  # banco fora do ar: tenta de novo; os clientes repõem pelo Last-Event-ID
+        finally:
+            if conn is not None and not conn.is_closed(): await conn.close()
+        await asyncio.sleep(2)
+
+
+def start_listener():
+    global _listener_task
+    if EVENTS_BACKEND == "postgres" and _listener_task is None:
+        _listener_task = asyncio.get_running_loop().create_task(_pg_listen())
+
+
+def stop_listener():
+    global _listener_task
+    if _listener_task is not None: _listener_task.cancel(); _listener_task = None
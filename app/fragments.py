@@ -0,0 +1,42 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Quantos blocos de dia renderizados manter em memória por worker
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "2048"))
+
+
+class FragmentCache:
+    """Cache LRU de HTML já renderizado.
+
+    As chaves levam o `version` do DaySummary, então uma escrita no dia simplesmente
+    gera uma chave nova e a antiga sai do cache pelo LRU; não há invalidação explícita.
+    """
+
+    def __init__(self, maxsize: int = FRAGMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._data.get(key)
+            if html is not None: self._data.move_to_end(key)
+            return html
+
+    def set(self, key, html):
+        if self.maxsize <= 0: return
+        with self._lock:
+            self._data[key] = html
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+fragment_cache = FragmentCache()
+
+
+def day_key(couple_id: int, day: str, version, viewer_id: int, partner_name: str):
+    """Chave de um bloco de dia: o mesmo dia aparece diferente para cada um do casal."""
+    if not version: return None  # dia sem resumo (banco ainda sem backfill): não cacheia
+    return (couple_id, day, version, viewer_id, partner_name)
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from fastapi import Depends, Request
+from sqlalchemy.orm import Session, aliased
+
+from .db import get_db, run_db
+from .models import User, Couple
+
+# Quantos casais manter em cache e por quantos segundos
+ROSTER_CACHE_SIZE = int(os.getenv("ROSTER_CACHE_SIZE", "1024"))
+ROSTER_CACHE_TTL = float(os.getenv("ROSTER_CACHE_TTL", "60"))
+
+
+class RosterCache:
+    """Cache LRU com TTL dos integrantes de cada casal: couple_id -> ((id, nome), ...)."""
+
+    def __init__(self, maxsize: int = ROSTER_CACHE_SIZE, ttl: float = ROSTER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, uid: int):
+        """Devolve (couple_id, elenco) do casal do usuário, se estiver em cache e válido."""
+        with self._lock:
+            couple_id = self._by_user.get(uid)
+            item = self._data.get(couple_id) if couple_id is not None else None
+            if item is None: return None
+            expires, roster = item
+            if expires < time.monotonic():
+                self._drop(couple_id)
+                return None
+            self._data.move_to_end(couple_id)
+            return couple_id, roster
+
+    def set(self, couple_id: int, roster: tuple):
+        with self._lock:
+            self._data[couple_id] = (time.monotonic() + self.ttl, roster)
+            self._data.move_to_end(couple_id)
+            for mid, _ in roster: self._by_user[mid] = couple_id
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+
+    def _drop(self, couple_id: int):
+        _, roster = self._data.pop(couple_id, (None, ()))
+        for mid, _ in roster: self._by_user.pop(mid, None)
+
+    def invalidate(self, couple_id: int):
+        with self._lock:
+            self._drop(couple_id)
+
+
+roster_cache = RosterCache()
+
+
+def roles_for(roster: tuple, my_user_id: int) -> dict:
+    """Quem é "me" e quem é "par" é decidido pela ordem de cadastro no casal."""
+    if len(roster) < 2: return {"self_role": "me", "partner_role": "par", "partner_name": "Aguardando..."}
+    (first_id, first_name), (_, second_name) = roster[0], roster[1]
+    if my_user_id == first_id: return {"self_role": "me", "partner_role": "par", "partner_name": second_name}
+    return {"self_role": "par", "partner_role": "me", "partner_name": first_name}
+
+
+@dataclass
+class Identity:
+    user: User
+    couple: Couple | None
+    roster: tuple = ()
+    roles: dict = field(init=False)
+
+    def __post_init__(self):
+        self.roles = roles_for(self.roster, self.user.id)
+
+
+def load_identity(db: Session, uid: int) -> Identity | None:
+    """Carrega usuário, casal e par numa única consulta com join.
+
+    Se o elenco do casal já está em cache, a consulta traz só usuário + casal.
+    """
+    cached = roster_cache.get(uid)
+    if cached:
+        row = db.query(User, Couple).outerjoin(Couple, User.couple_id == Couple.id).filter(User.id == uid).first()
+        if not row: return None
+        user, couple = row
+        if couple and couple.id == cached[0]: return Identity(user, couple, cached[1])
+
+    mate = aliased(User)
+    rows = (
+        db.query(User, Couple, mate.id, mate.name)
+        .outerjoin(Couple, User.couple_id == Couple.id)
+        .outerjoin(mate, mate.couple_id == User.couple_id)
+        .filter(User.id == uid)
+        .order_by(mate.id.asc())
+        .all()
+    )
+    if not rows: return None
+    user, couple = rows[0][0], rows[0][1]
+    if not couple: return Identity(user, None)
+
+    roster = tuple((mid, mname) for _, _, mid, mname in rows[:2])
+    # Casal incompleto ainda vai mudar (par entrando por outro worker), então só cacheia completo
+    if len(roster) >= 2: roster_cache.set(couple.id, roster)
+    return Identity(user, couple, roster)
+
+
+async def get_identity(request: Request, db: Session = Depends(get_db)) -> Identity | None:
+    """Dependência do FastAPI: identidade resolvida da sessão, ou None se deslogado."""
+    uid = request.session.get("uid")
+    if not uid: return None
+    return await run_db(db, load_identity, uid)
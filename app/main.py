@@ -1,38 +1,75 @@
+import hashlib
 import os
 import secrets
+import tempfile
 import random
-from datetime import date, datetime
+import zipfile
+from datetime import date, datetime, timedelta
 from itertools import zip_longest
 
-from fastapi import FastAPI, Request, Form, Depends, Path
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, Form, Depends, Path, BackgroundTasks, UploadFile, File
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, FileResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
-from .db import Base, engine, get_db
-from .models import User, Couple, Entry
-from .security import hash_password, verify_password
+from .db import Base, engine, get_db, run_db, SessionLocal, pool_stats
+from .migrate import ensure_schema
+from .models import User, Couple, Entry, EntryTag, split_tags, join_tags
+from .security import HashingBusy, hash_password_async, verify_password_async, shutdown_hash_pool
+from .identity import Identity, get_identity, roster_cache
+from . import summaries, events, search, backup
+from .fragments import fragment_cache, day_key
+from .assets import CachedStaticFiles, static_url, build_id
+from .pwa import ensure_precache_manifest
+from .sessions import SESSION_BACKEND, ServerSessionMiddleware, make_store
+from .perf import PERF_METRICS, METRICS_TOKEN, PerfMiddleware, TimedTemplate, metrics
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
 Base.metadata.create_all(bind=engine)
+ensure_schema(engine)
+search.ensure_search_schema(engine)
+ensure_precache_manifest()
 
 app = FastAPI(title="Duo")
 
-app.add_middleware(
-    SessionMiddleware,
-    secret_key=os.getenv("SECRET_KEY", "duo-secret-key-change-me"),
-    same_site="lax",
-    https_only=False,
-    max_age=60 * 60 * 24 * 7,
-)
+SECRET_KEY = os.getenv("SECRET_KEY", "duo-secret-key-change-me")
+SESSION_MAX_AGE = 60 * 60 * 24 * 7
 
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+if SESSION_BACKEND == "cookie":
+    app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY, same_site="lax", https_only=False, max_age=SESSION_MAX_AGE)
+else:
+    # Só o ID no cookie; o secret ainda lê os cookies assinados de antes da troca
+    app.add_middleware(ServerSessionMiddleware, store=make_store(), same_site="lax", https_only=False, max_age=SESSION_MAX_AGE, legacy_secret=SECRET_KEY)
+# Por último = mais externo: o tempo medido inclui a sessão
+if PERF_METRICS: app.add_middleware(PerfMiddleware)
+
+@app.on_event("startup")
+async def _start_events_listener(): events.start_listener()
+
+@app.on_event("shutdown")
+def _stop_hash_pool(): shutdown_hash_pool(); events.stop_listener()
+
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
+templates.env.globals["static_url"] = static_url
+
+# Bytecode dos templates em disco: worker novo carrega o compilado em vez de recompilar
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "duo-jinja-cache"))
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+templates.env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+if PERF_METRICS: templates.env.template_class = TimedTemplate
+for _name in templates.env.list_templates(extensions=["html"]): templates.env.get_template(_name)
+
+# Quantos dias a home renderiza por página da linha do tempo
+TIMELINE_PAGE_DAYS = int(os.getenv("TIMELINE_PAGE_DAYS", "14"))
 
 # =====================================================
 # CONTEÚDO (NOVAS PERGUNTAS E TEXTOS)
@@ -82,189 +119,399 @@ QUESTION_SETS = {
 # HELPERS
 # =====================================================
 def redirect_to(url: str): return RedirectResponse(url, status_code=303)
-def current_user(request: Request, db: Session):
-    uid = request.session.get("uid")
-    if not uid: return None
-    return db.get(User, uid)
-def get_couple_roles(db: Session, couple_id: int, my_user_id: int):
-    users = db.query(User).filter(User.couple_id == couple_id).order_by(User.id.asc()).all()
-    if len(users) < 2: return {"self_role": "me", "partner_role": "par", "partner_name": "Aguardando..."}
-    first, second = users[0], users[1]
-    if my_user_id == first.id: return {"self_role": "me", "partner_role": "par", "partner_name": second.name}
-    return {"self_role": "par", "partner_role": "me", "partner_name": first.name}
-def split_tags(csv: str): return [t for t in (csv or "").split(",") if t.strip()]
-def join_tags(tags: list[str]): return ",".join(list(dict.fromkeys([t.strip() for t in (tags or []) if t.strip()])))
+BUSY_MSG = "Muita gente entrando agora 😅 Tenta de novo em alguns segundos."
+
+def load_timeline(db: Session, couple_id: int, roles: dict, viewer_id: int, before: str | None = None, limit: int = TIMELINE_PAGE_DAYS):
+    """Carrega uma página da linha do tempo (keyset por dia) e devolve (dias, próximo cursor).
+
+    Primeiro busca só os `limit` dias mais recentes anteriores a `before` pelo índice
+    ix_entries_couple_day, então o custo não cresce com a idade do casal. Dias cujo
+    bloco já está no fragment_cache (mesmo `version`) voltam com "html" pronto e nem
+    têm as entradas carregadas; os demais voltam com os dados para render_timeline.
+    """
+    q = db.query(Entry.day).filter(Entry.couple_id == couple_id)
+    if before: q = q.filter(Entry.day < before)
+    days = [d for (d,) in q.distinct().order_by(Entry.day.desc()).limit(limit + 1)]
+    next_cursor = days[limit - 1] if len(days) > limit else None
+    days = days[:limit]
+    if not days: return [], None
+
+    versions = summaries.day_versions(db, couple_id, days)
+    items, missing = [], []
+    for day in days:
+        key = day_key(couple_id, day, versions.get(day), viewer_id, roles["partner_name"])
+        html = fragment_cache.get(key) if key else None
+        items.append({"day": day, "key": key, "html": html})
+        if html is None: missing.append(day)
+    if not missing: return items, next_cursor
+
+    entries = db.query(Entry).filter(
+        Entry.couple_id == couple_id, Entry.day.in_(missing)
+    ).order_by(Entry.day.desc(), Entry.id.desc()).all()
+
+    by_day = {}
+    for e in entries:
+        if e.day not in by_day:
+            by_day[e.day] = {"day": e.day, "display_date": datetime.strptime(e.day, "%Y-%m-%d").strftime("%d/%m") if "-" in e.day else e.day, "me_entries": [], "par_entries": []}
+        data = {
+            "id": e.id, # Importante para deletar
+            "mood": e.mood, "moment_special": e.moment_special, "love_action": e.love_action, 
+            "character": e.character, "music": e.music, "tags": split_tags(e.tags_csv),
+            "time": e.created_at.astimezone().strftime("%H:%M") if e.created_at else e.updated_at.split(" ")[1] if e.updated_at and " " in e.updated_at else ""
+        }
+        if e.author == roles["self_role"]: by_day[e.day]["me_entries"].append(data)
+        elif e.author == roles["partner_role"]: by_day[e.day]["par_entries"].append(data)
+
+    for item in items:
+        obj = by_day.get(item["day"])
+        if item["html"] is not None or obj is None: continue
+        obj["rows"] = list(zip_longest(obj["me_entries"], obj["par_entries"], fillvalue=None))
+        item["day_data"] = obj
+    return items, next_cursor
+
+def render_timeline(items: list, user: User, partner_name: str) -> list[Markup]:
+    """Renderiza só os dias que não vieram do cache e guarda o resultado para o próximo request."""
+    template = templates.get_template("_timeline_day.html")
+    blocks = []
+    for item in items:
+        html = item["html"]
+        if html is None:
+            if "day_data" not in item: continue  # dia apagado entre as duas consultas
+            html = Markup(template.render(day_data=item["day_data"], user=user, partner_name=partner_name))
+            if item["key"]: fragment_cache.set(item["key"], html)
+        blocks.append(html)
+    return blocks
+
+# =====================================================
+# CONSULTAS (síncronas; as rotas chamam via run_db)
+# =====================================================
+def find_user_by_email(db: Session, email: str): return db.query(User).filter(User.email == email).first()
+
+def create_user(db: Session, name: str, email: str, password_hash: str):
+    user = User(name=name, email=email, password_hash=password_hash)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+def create_couple(db: Session, user: User):
+    couple = Couple(code=secrets.token_hex(4))
+    db.add(couple); db.commit(); db.refresh(couple)
+    user.couple_id = couple.id; db.commit()
+    return couple
+
+def join_couple(db: Session, user: User, code: str):
+    couple = db.query(Couple).filter(Couple.code == (code or "").strip()).first()
+    if not couple: return None
+    user.couple_id = couple.id; db.commit()
+    return couple
+
+def store_upgraded_hash(user_id: int, old_hash: str, new_hash: str):
+    # Só troca se a senha não mudou nesse meio tempo
+    with SessionLocal() as db:
+        db.execute(update(User).where(User.id == user_id, User.password_hash == old_hash).values(password_hash=new_hash))
+        db.commit()
+
+async def upgrade_password_hash(user_id: int, old_hash: str, password: str):
+    """Tarefa em background: refaz com os parâmetros atuais o hash de quem acabou de logar."""
+    try: new_hash = await hash_password_async(password)
+    except HashingBusy: return  # tenta de novo no próximo login
+    await run_in_threadpool(store_upgraded_hash, user_id, old_hash, new_hash)
+
+def timeline_etag(me: Identity, version: int, saudacao: str) -> str:
+    """ETag fraco da home: muda com qualquer escrita do casal, com o dia, a saudação e o deploy."""
+    raw = f"{me.user.id}|{me.user.name}|{me.roles['partner_name']}|{version}|{date.today().isoformat()}|{saudacao}|{build_id()}"
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    return header.strip() == "*" or etag in [t.strip() for t in header.split(",")]
+
+def home_data(db: Session, couple_id: int, roles: dict, viewer_id: int):
+    items, next_cursor = load_timeline(db, couple_id, roles, viewer_id)
+    return items, next_cursor, summaries.day_summary(db, couple_id, date.today().isoformat())
+
+def save_entry(db: Session, entry: Entry, by: int) -> dict:
+    db.add(entry); summaries.add_entry(db, entry); search.index_entry(db, entry)
+    event = events.record_event(db, entry.couple_id, "entry_saved", entry.day, by)
+    db.commit()
+    return event
+
+def delete_couple_entry(db: Session, couple_id: int, entry_id: int, by: int) -> dict | None:
+    # Só pode deletar se for do próprio casal
+    entry = db.get(Entry, entry_id)
+    if entry and entry.couple_id == couple_id:
+        db.delete(entry)
+        summaries.remove_entry(db, entry)
+        search.unindex_entry(db, entry.id)
+        event = events.record_event(db, couple_id, "entry_deleted", entry.day, by)
+        db.commit()
+        return event
+    return None
 
 # =====================================================
 # ROTAS GERAIS
 # =====================================================
 @app.get("/login", response_class=HTMLResponse)
-def login_page(request: Request): return templates.TemplateResponse("login.html", {"request": request})
+async def login_page(request: Request): return templates.TemplateResponse("login.html", {"request": request})
 
 @app.post("/login")
-def login(request: Request, email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+async def login(request: Request, background: BackgroundTasks, email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
     email_norm = (email or "").strip().lower()
-    user = db.query(User).filter(User.email == email_norm).first()
-    if not user or not verify_password(password, user.password_hash):
+    user = await run_db(db, find_user_by_email, email_norm)
+    try: ok, stale = await verify_password_async(password, user.password_hash) if user else (False, False)
+    except HashingBusy: return templates.TemplateResponse("login.html", {"request": request, "error": BUSY_MSG}, status_code=503)
+    if not ok:
         return templates.TemplateResponse("login.html", {"request": request, "error": "E-mail ou senha incorretos."}, status_code=400)
+    if stale: background.add_task(upgrade_password_hash, user.id, user.password_hash, password)
     request.session["uid"] = user.id
     return redirect_to("/")
 
 @app.get("/signup", response_class=HTMLResponse)
-def signup_page(request: Request): return templates.TemplateResponse("signup.html", {"request": request})
+async def signup_page(request: Request): return templates.TemplateResponse("signup.html", {"request": request})
 
 @app.post("/signup")
-def signup(request: Request, name: str = Form(...), email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+async def signup(request: Request, name: str = Form(...), email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
     name_norm = (name or "").strip()
     email_norm = (email or "").strip().lower()
-    if db.query(User).filter(User.email == email_norm).first():
+    if await run_db(db, find_user_by_email, email_norm):
         return templates.TemplateResponse("signup.html", {"request": request, "error": "Este e-mail já tem conta."}, status_code=400)
-    user = User(name=name_norm, email=email_norm, password_hash=hash_password(password))
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    try: password_hash = await hash_password_async(password)
+    except HashingBusy: return templates.TemplateResponse("signup.html", {"request": request, "error": BUSY_MSG}, status_code=503)
+    user = await run_db(db, create_user, name_norm, email_norm, password_hash)
     request.session["uid"] = user.id
     return redirect_to("/pair")
 
 @app.get("/logout")
-def logout(request: Request): request.session.clear(); return redirect_to("/login")
+async def logout(request: Request): request.session.clear(); return redirect_to("/login")
 
 # =====================================================
 # PERFIL & SENHA (NOVO)
 # =====================================================
 @app.get("/profile", response_class=HTMLResponse)
-def profile_page(request: Request, db: Session = Depends(get_db)):
-    u = current_user(request, db)
-    if not u: return redirect_to("/login")
-    return templates.TemplateResponse("profile.html", {"request": request, "user": u})
+async def profile_page(request: Request, me: Identity | None = Depends(get_identity)):
+    if not me: return redirect_to("/login")
+    return templates.TemplateResponse("profile.html", {"request": request, "user": me.user})
 
 @app.post("/profile/update_password")
-def update_password(request: Request, new_password: str = Form(...), db: Session = Depends(get_db)):
-    u = current_user(request, db)
-    if not u: return redirect_to("/login")
+async def update_password(request: Request, new_password: str = Form(...), me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    if not me: return redirect_to("/login")
+    u = me.user
     
     if len(new_password) < 4:
         return templates.TemplateResponse("profile.html", {"request": request, "user": u, "error": "Senha muito curta!"})
         
-    u.password_hash = hash_password(new_password)
-    db.commit()
+    try: u.password_hash = await hash_password_async(new_password)
+    except HashingBusy: return templates.TemplateResponse("profile.html", {"request": request, "user": u, "error": BUSY_MSG}, status_code=503)
+    await run_db(db, Session.commit)
     return templates.TemplateResponse("profile.html", {"request": request, "user": u, "success": "Senha alterada com sucesso!"})
 
+# =====================================================
+# BACKUP (exportar / importar o diário)
+# =====================================================
+@app.get("/export")
+async def export_diary(me: Identity | None = Depends(get_identity)):
+    if not me: return redirect_to("/login")
+    if not me.couple: return redirect_to("/pair")
+    # Gerador síncrono com sessão própria: o Starlette itera no threadpool, em pedaços
+    filename = f"duo-{me.couple.code}-{date.today().isoformat()}.zip"
+    return StreamingResponse(backup.export_couple(me.couple.id), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"})
+
+def import_upload(fileobj, couple_id: int) -> dict:
+    with SessionLocal() as db: return backup.import_couple(db, fileobj, couple_id)
+
+@app.post("/import")
+async def import_diary(request: Request, file: UploadFile = File(...), me: Identity | None = Depends(get_identity)):
+    if not me: return redirect_to("/login")
+    if not me.couple: return redirect_to("/pair")
+    ctx = {"request": request, "user": me.user}
+    try: result = await run_in_threadpool(import_upload, file.file, me.couple.id)
+    except backup.InvalidArchive as e: return templates.TemplateResponse("profile.html", {**ctx, "error": "Arquivo inválido: " + "; ".join(e.errors[:3])}, status_code=400)
+    except zipfile.BadZipFile: return templates.TemplateResponse("profile.html", {**ctx, "error": "Isso não parece um backup do Duo (.zip)."}, status_code=400)
+    return templates.TemplateResponse("profile.html", {**ctx, "success": f"{result['entries']} registros importados!"})
+
 # =====================================================
 # PAREAMENTO
 # =====================================================
 @app.get("/pair", response_class=HTMLResponse)
-def pair_page(request: Request, db: Session = Depends(get_db)):
-    u = current_user(request, db)
-    if not u: return redirect_to("/login")
-    roles = get_couple_roles(db, u.couple_id, u.id) if u.couple_id else {}
-    return templates.TemplateResponse("pair.html", {"request": request, "user": u, "couple": db.get(Couple, u.couple_id) if u.couple_id else None, "partner_name": roles.get("partner_name")})
+async def pair_page(request: Request, me: Identity | None = Depends(get_identity)):
+    if not me: return redirect_to("/login")
+    return templates.TemplateResponse("pair.html", {"request": request, "user": me.user, "couple": me.couple, "partner_name": me.roles["partner_name"] if me.couple else None})
 
 @app.post("/pair/create")
-def pair_create(request: Request, db: Session = Depends(get_db)):
-    u = current_user(request, db)
-    if not u or u.couple_id: return redirect_to("/")
-    couple = Couple(code=secrets.token_hex(4))
-    db.add(couple); db.commit(); db.refresh(couple)
-    u.couple_id = couple.id; db.commit()
+async def pair_create(request: Request, me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    if not me or me.user.couple_id: return redirect_to("/")
+    couple = await run_db(db, create_couple, me.user)
+    roster_cache.invalidate(couple.id)
     return redirect_to("/pair")
 
 @app.post("/pair/join")
-def pair_join(request: Request, code: str = Form(...), db: Session = Depends(get_db)):
-    u = current_user(request, db)
-    if not u or u.couple_id: return redirect_to("/")
-    couple = db.query(Couple).filter(Couple.code == (code or "").strip()).first()
-    if not couple: return templates.TemplateResponse("pair.html", {"request": request, "user": u, "error": "Código não encontrado."}, status_code=400)
-    u.couple_id = couple.id; db.commit()
+async def pair_join(request: Request, code: str = Form(...), me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    if not me or me.user.couple_id: return redirect_to("/")
+    couple = await run_db(db, join_couple, me.user, code)
+    if not couple: return templates.TemplateResponse("pair.html", {"request": request, "user": me.user, "error": "Código não encontrado."}, status_code=400)
+    roster_cache.invalidate(couple.id)
     return redirect_to("/")
 
 # =====================================================
 # HOME & DIÁRIO
 # =====================================================
 @app.get("/", response_class=HTMLResponse)
-def home(request: Request, db: Session = Depends(get_db)):
-    u = current_user(request, db)
-    if not u: return redirect_to("/login")
-    if not u.couple_id: return redirect_to("/pair")
+async def home(request: Request, me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    if not me: return redirect_to("/login")
+    if not me.couple: return redirect_to("/pair")
 
-    roles = get_couple_roles(db, u.couple_id, u.id)
-    entries = db.query(Entry).filter(Entry.couple_id == u.couple_id).order_by(Entry.day.desc(), Entry.id.desc()).all()
-    
-    by_day = {}
-    for e in entries:
-        if e.day not in by_day:
-            by_day[e.day] = {"day": e.day, "display_date": datetime.strptime(e.day, "%Y-%m-%d").strftime("%d/%m") if "-" in e.day else e.day, "me_entries": [], "par_entries": []}
-        data = {
-            "id": e.id, # Importante para deletar
-            "mood": e.mood, "moment_special": e.moment_special, "love_action": e.love_action, 
-            "character": e.character, "music": e.music, "tags": split_tags(e.tags_csv),
-            "time": e.updated_at.split(" ")[1] if e.updated_at and " " in e.updated_at else ""
-        }
-        if e.author == roles["self_role"]: by_day[e.day]["me_entries"].append(data)
-        elif e.author == roles["partner_role"]: by_day[e.day]["par_entries"].append(data)
+    u, roles = me.user, me.roles
+    h = datetime.now().hour
+    saudacao = "Bom dia" if 5<=h<12 else "Boa tarde" if 12<=h<18 else "Boa noite"
 
-    timeline = []
-    for day in sorted(by_day.keys(), reverse=True):
-        obj = by_day[day]
-        obj["rows"] = list(zip_longest(obj["me_entries"], obj["par_entries"], fillvalue=None))
-        timeline.append(obj)
+    # Revisita sem nada novo (ex.: PWA instalado): 304 sem montar timeline nem template
+    etag = timeline_etag(me, await run_db(db, summaries.couple_version, u.couple_id), saudacao)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Cookie"}
+    if etag_matches(request, etag): return Response(status_code=304, headers=cache_headers)
 
-    has_today = any(d['day'] == date.today().isoformat() for d in timeline)
-    syn = 0
-    if has_today:
-        td = next(d for d in timeline if d['day'] == date.today().isoformat())
-        if td["me_entries"] and td["par_entries"]: syn = 100
-        elif td["me_entries"] or td["par_entries"]: syn = 50
+    items, next_cursor, today = await run_db(db, home_data, u.couple_id, roles, u.id)
+    timeline = render_timeline(items, u, roles["partner_name"])
+
+    has_today, syn = summaries.synergy(today)
 
-    h = datetime.now().hour
-    saudacao = "Bom dia" if 5<=h<12 else "Boa tarde" if 12<=h<18 else "Boa noite"
     return templates.TemplateResponse("index.html", {
-        "request": request, "user": u, "partner_name": roles["partner_name"], "timeline": timeline, "diary_tags": DIARY_TAGS,
+        "request": request, "user": u, "partner_name": roles["partner_name"], "timeline": timeline, "next_cursor": next_cursor, "diary_tags": DIARY_TAGS,
         "has_today": has_today, "synergy_percent": syn, "saudacao": saudacao, "ph_humor": random.choice(PROMPTS_HUMOR), "ph_momento": random.choice(PROMPTS_MOMENTO)
+    }, headers=cache_headers)
+
+@app.get("/timeline", response_class=HTMLResponse)
+async def timeline_page(request: Request, before: str, me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    if not me: return redirect_to("/login")
+    if not me.couple: return redirect_to("/pair")
+    try: date.fromisoformat(before)
+    except ValueError: return HTMLResponse("", status_code=400)
+
+    u, roles = me.user, me.roles
+    items, next_cursor = await run_db(db, load_timeline, u.couple_id, roles, u.id, before=before)
+    timeline = render_timeline(items, u, roles["partner_name"])
+    return templates.TemplateResponse("_timeline_days.html", {
+        "request": request, "user": u, "partner_name": roles["partner_name"], "timeline": timeline, "next_cursor": next_cursor
     })
 
 @app.post("/save_side")
-def save_side(request: Request, side: str = Form(...), mood: str = Form(""), moment_special: str = Form(""), love_action: str = Form(""), character: str = Form(""), music: str = Form(""), tags: list[str] = Form(default=[]), db: Session = Depends(get_db)):
-    u = current_user(request, db)
-    if not u or not u.couple_id: return redirect_to("/")
-    roles = get_couple_roles(db, u.couple_id, u.id)
-    entry = Entry(couple_id=u.couple_id, day=date.today().isoformat(), author=roles["self_role"] if side == "self" else roles["partner_role"])
+async def save_side(request: Request, side: str = Form(...), mood: str = Form(""), moment_special: str = Form(""), love_action: str = Form(""), character: str = Form(""), music: str = Form(""), tags: list[str] = Form(default=[]), me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    if not me or not me.couple: return redirect_to("/")
+    u, roles = me.user, me.roles
+    now = datetime.now().astimezone()
+    entry = Entry(couple_id=u.couple_id, day=now.date().isoformat(), day_date=now.date(), created_at=now, author=roles["self_role"] if side == "self" else roles["partner_role"])
     entry.mood = mood; entry.moment_special = moment_special; entry.love_action = love_action
-    entry.character = character; entry.music = music; entry.updated_at = datetime.now().strftime("%d/%m %H:%M")
+    entry.character = character; entry.music = music; entry.updated_at = now.strftime("%d/%m %H:%M")
     entry.tags_csv = join_tags([t for t in tags if t in DIARY_TAGS])
-    db.add(entry); db.commit()
+    entry.tag_links = [EntryTag(couple_id=u.couple_id, tag=t) for t in split_tags(entry.tags_csv)]
+    events.publish(await run_db(db, save_entry, entry, u.id))
     return redirect_to("/")
 
 @app.post("/delete_entry/{entry_id}")
-def delete_entry(entry_id: int, request: Request, db: Session = Depends(get_db)):
-    u = current_user(request, db)
-    if not u: return redirect_to("/login")
-    
-    # Só pode deletar se for do próprio casal
-    entry = db.get(Entry, entry_id)
-    if entry and entry.couple_id == u.couple_id:
-        db.delete(entry)
-        db.commit()
-    
+async def delete_entry(entry_id: int, request: Request, me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    if not me: return redirect_to("/login")
+    events.publish(await run_db(db, delete_couple_entry, me.user.couple_id, entry_id, me.user.id))
     return redirect_to("/")
 
+# =====================================================
+# BUSCA
+# =====================================================
+def search_results(db: Session, couple_id: int, roles: dict, q: str, page: int):
+    found, has_next = search.search_entries(db, couple_id, q, page)
+    results = [{
+        "id": e.id, "day": e.day,
+        "display_date": datetime.strptime(e.day, "%Y-%m-%d").strftime("%d/%m/%Y") if "-" in e.day else e.day,
+        "who": "me" if e.author == roles["self_role"] else "par",
+        "mood": e.mood, "moment_special": e.moment_special, "love_action": e.love_action,
+        "character": e.character, "music": e.music,
+    } for e in found]
+    return results, has_next
+
+@app.get("/search", response_class=HTMLResponse)
+async def search_page(request: Request, q: str = "", page: int = 1, me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    if not me: return redirect_to("/login")
+    if not me.couple: return redirect_to("/pair")
+    u, roles = me.user, me.roles
+    q, page = q.strip()[:200], max(page, 1)
+    results, has_next = await run_db(db, search_results, u.couple_id, roles, q, page) if q else ([], False)
+    return templates.TemplateResponse("search.html", {
+        "request": request, "user": u, "partner_name": roles["partner_name"], "q": q, "page": page,
+        "results": results, "has_next": has_next,
+    })
+
+# =====================================================
+# AO VIVO (SSE)
+# =====================================================
+@app.get("/events")
+async def events_stream(request: Request, me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    # 401 faz o EventSource desistir em vez de ficar reconectando deslogado
+    if not me or not me.couple: return Response(status_code=401)
+    raw = request.headers.get("last-event-id") or request.query_params.get("last_id") or ""
+    last_id = int(raw) if raw.isdigit() else 0
+    # Inscreve antes de repor: o que chegar no meio vem pela fila e é filtrado pelo id
+    queue = events.broker.subscribe(me.couple.id)
+    try:
+        replay = await run_db(db, events.events_after, me.couple.id, last_id) if last_id else []
+    except BaseException:
+        # Erro (ou cancelamento) antes do stream começar: o finally do gerador nunca rodaria
+        events.broker.unsubscribe(me.couple.id, queue)
+        raise
+    return StreamingResponse(
+        events.stream(me.couple.id, queue, replay, last_id), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/timeline/day/{day}", response_class=HTMLResponse)
+async def timeline_day(request: Request, day: str, me: Identity | None = Depends(get_identity), db: Session = Depends(get_db)):
+    """Bloco de um dia só (o cliente troca o card quando chega um evento); vazio se o dia ficou sem entradas."""
+    if not me: return redirect_to("/login")
+    if not me.couple: return redirect_to("/pair")
+    try: next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+    except ValueError: return HTMLResponse("", status_code=400)
+
+    u, roles = me.user, me.roles
+    items, _ = await run_db(db, load_timeline, u.couple_id, roles, u.id, before=next_day, limit=1)
+    blocks = render_timeline([i for i in items if i["day"] == day], u, roles["partner_name"])
+    return HTMLResponse("".join(blocks), headers={"Cache-Control": "no-store"})
+
+# =====================================================
+# PWA
+# =====================================================
+@app.get("/sw.js")
+async def service_worker():
+    # Na raiz para o escopo ser o site todo; no-cache para atualizações chegarem logo
+    return FileResponse(os.path.join(STATIC_DIR, "js", "sw.js"), media_type="application/javascript", headers={"Cache-Control": "no-cache"})
+
+@app.get("/offline", response_class=HTMLResponse)
+async def offline_page(request: Request): return templates.TemplateResponse("offline.html", {"request": request})
+
+# =====================================================
+# MÉTRICAS (só com PERF_METRICS=1)
+# =====================================================
+if PERF_METRICS:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics(request: Request):
+        if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+            return Response(status_code=401)
+        return Response(metrics.render(pool_stats()), media_type="text/plain; version=0.0.4")
+
 # =====================================================
 # PUXA-PAPO
 # =====================================================
 @app.get("/puxa-papo", response_class=HTMLResponse)
-def puxa_papo(request: Request, db: Session = Depends(get_db)):
-    u = current_user(request, db)
-    if not u: return redirect_to("/login")
+async def puxa_papo(request: Request, me: Identity | None = Depends(get_identity)):
+    if not me: return redirect_to("/login")
     
     modes = [("divertidas", "😄 Divertidas"), ("romanticas", "💖 Românticas"), ("picantes_leves", "🔥 Picantes"), ("profundas", "🧠 Profundas")]
     
     return templates.TemplateResponse("puxa_papo.html", {
-        "request": request, "user": u, "partner_name": "", 
+        "request": request, "user": me.user, "partner_name": "", 
         "modes": modes, 
         "last": request.session.get("puxa_papo_last")
     })
 
 @app.post("/puxa-papo/next")
-def puxa_next(request: Request, mode: str = Form("divertidas")):
+async def puxa_next(request: Request, mode: str = Form("divertidas")):
     request.session["puxa_papo_last"] = {"mode": mode, "question": random.choice(QUESTION_SETS.get(mode, QUESTION_SETS["divertidas"]))}
     return redirect_to("/puxa-papo")
@@ -0,0 +1,133 @@
+"""Comandos de manutenção do Duo.
+
+Uso: python -m app.manage <comando> [opções]
+"""
+import argparse
+
+from .db import Base, engine, SessionLocal
+from . import models  # noqa: F401  (registra as tabelas no Base)
+from .migrate import ensure_schema, backfill_typed_columns
+from .summaries import rebuild_summaries
+from .pwa import write_precache_manifest
+from .search import ensure_search_schema, rebuild_search
+
+
+def cmd_rebuild_summaries(args):
+    db = SessionLocal()
+    try:
+        n = rebuild_summaries(db, couple_id=args.couple, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"{n} resumos diários recalculados.")
+
+
+def cmd_migrate_typed(args):
+    db = SessionLocal()
+    try:
+        n = backfill_typed_columns(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"{n} entradas processadas para as colunas tipadas.")
+
+
+def cmd_rebuild_search(args):
+    db = SessionLocal()
+    try:
+        n = rebuild_search(db, couple_id=args.couple, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"{n} entradas indexadas para a busca.")
+
+
+def cmd_build_sw(args):
+    manifest = write_precache_manifest()
+    print(f"precache {manifest['version']}: {len(manifest['urls'])} URLs")
+
+
+def cmd_sweep_sessions(args):
+    from .sessions import DBSessionStore
+    n = DBSessionStore().sweep(batch_size=args.batch_size)
+    print(f"{n} sessões expiradas removidas.")
+
+
+def cmd_sweep_events(args):
+    from .events import sweep_events
+    db = SessionLocal()
+    try:
+        n = sweep_events(db, keep_days=args.keep_days, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"{n} eventos antigos removidos.")
+
+
+def cmd_export(args):
+    from .backup import export_couple
+    with open(args.output or f"duo-couple-{args.couple}.zip", "wb") as f:
+        for chunk in export_couple(args.couple, with_users=args.with_users): f.write(chunk)
+        print(f"casal {args.couple} exportado para {f.name}")
+
+
+def cmd_import(args):
+    from .backup import import_couple, InvalidArchive
+    db = SessionLocal()
+    try:
+        with open(args.file, "rb") as f: result = import_couple(db, f, couple_id=args.couple, replace=args.replace, batch_size=args.batch_size)
+    except InvalidArchive as e:
+        raise SystemExit("arquivo inválido:\n  " + "\n  ".join(e.errors))
+    finally:
+        db.close()
+    print(f"casal {result['couple_id']}: " + ", ".join(f"{n} {k}" for k, n in result.items() if k != "couple_id"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage", description="Manutenção do banco do Duo")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-summaries", help="recalcula a tabela day_summaries a partir das entradas")
+    p.add_argument("--couple", type=int, default=None, help="só este casal (padrão: todos)")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.set_defaults(func=cmd_rebuild_summaries)
+
+    p = sub.add_parser("migrate-typed", help="preenche day_date, created_at e entry_tags das entradas antigas")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.set_defaults(func=cmd_migrate_typed)
+
+    p = sub.add_parser("rebuild-search", help="refaz o índice de busca (FTS5/tsvector) a partir das entradas")
+    p.add_argument("--couple", type=int, default=None, help="só este casal (padrão: todos)")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.set_defaults(func=cmd_rebuild_search)
+
+    p = sub.add_parser("build-sw", help="gera static/js/precache-manifest.js para o service worker")
+    p.set_defaults(func=cmd_build_sw)
+
+    p = sub.add_parser("sweep-sessions", help="apaga as sessões expiradas da tabela sessions, em lotes")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.set_defaults(func=cmd_sweep_sessions)
+
+    p = sub.add_parser("sweep-events", help="apaga os eventos do /events mais velhos que --keep-days, em lotes")
+    p.add_argument("--keep-days", type=int, default=30)
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.set_defaults(func=cmd_sweep_events)
+
+    p = sub.add_parser("export", help="exporta o diário de um casal (zip de NDJSON), lendo em streaming")
+    p.add_argument("--couple", type=int, required=True)
+    p.add_argument("-o", "--output", help="arquivo de saída (padrão: duo-couple-<id>.zip)")
+    p.add_argument("--with-users", action="store_true", help="inclui os usuários (com hash da senha) para mudar de deploy")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="importa um zip do export em lotes; sem --couple cria o casal e os usuários do arquivo")
+    p.add_argument("file")
+    p.add_argument("--couple", type=int, default=None, help="casal de destino (padrão: novo)")
+    p.add_argument("--replace", action="store_true", help="apaga antes o diário atual do casal de destino")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.set_defaults(func=cmd_import)
+
+    args = parser.parse_args(argv)
+    Base.metadata.create_all(bind=engine)
+    ensure_schema(engine)
+    ensure_search_schema(engine)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
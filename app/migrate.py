@@ -0,0 +1,87 @@
+"""Migrações online do esquema (sem derrubar o app).
+
+`ensure_schema` roda no startup e só adiciona o que falta (colunas/índices novos em
+tabelas que o `create_all` não altera). Os backfills andam em lotes pequenos por
+chave primária, cada lote na sua transação, então dá pra rodar com o app no ar.
+"""
+from datetime import datetime
+
+from sqlalchemy import bindparam, inspect, insert, text, update
+from sqlalchemy.orm import Session
+
+from .models import Entry, EntryTag, DaySummary, Notification, split_tags
+
+
+def _add_missing_columns(conn, table, names):
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name, schema=table.schema)}
+    for name in names:
+        if name in existing: continue
+        col = table.c[name]
+        conn.execute(text(f"ALTER TABLE {table.fullname} ADD COLUMN {col.name} {col.type.compile(dialect=conn.dialect)}"))
+
+
+def _add_missing_indexes(conn, table):
+    existing = {ix["name"] for ix in inspect(conn).get_indexes(table.name, schema=table.schema)}
+    for ix in table.indexes:
+        if ix.name not in existing: ix.create(conn)
+
+
+def ensure_schema(engine):
+    """Acrescenta colunas/índices novos em bancos criados antes delas."""
+    new_columns = {Entry.__table__: ["day_date", "created_at"], DaySummary.__table__: ["version"], Notification.__table__: []}
+    with engine.begin() as conn:
+        for table, names in new_columns.items():
+            if not inspect(conn).has_table(table.name, schema=table.schema): continue
+            _add_missing_columns(conn, table, names)
+            _add_missing_indexes(conn, table)
+
+
+def _parse_day(day: str):
+    try: return datetime.strptime(day, "%Y-%m-%d").date()
+    except (TypeError, ValueError): return None
+
+
+def _parse_updated_at(updated_at: str, day):
+    """`updated_at` antigo é "%d/%m %H:%M" sem ano: o ano vem do dia da entrada."""
+    if not day or not updated_at: return None
+    try: parsed = datetime.strptime(f"{day.year}/{updated_at}", "%Y/%d/%m %H:%M")
+    except ValueError: return None
+    # Registro do fim de dezembro editado já em janeiro
+    if parsed.month < day.month: parsed = parsed.replace(year=day.year + 1)
+    return parsed.astimezone()
+
+
+_entries = Entry.__table__
+_TYPED_UPDATE = (
+    update(_entries)
+    .where(_entries.c.id == bindparam("b_id"))
+    .values(day_date=bindparam("b_day"), created_at=bindparam("b_created"))
+)
+
+
+def backfill_typed_columns(db: Session, batch_size: int = 500) -> int:
+    """Preenche day_date/created_at/entry_tags das entradas antigas. Devolve quantas foram processadas."""
+    last_id, migrated = 0, 0
+    while True:
+        rows = (
+            db.query(Entry.id, Entry.couple_id, Entry.day, Entry.updated_at, Entry.tags_csv)
+            .filter(Entry.id > last_id, Entry.day_date.is_(None))
+            .order_by(Entry.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows: return migrated
+        last_id = rows[-1].id
+
+        ids = [r.id for r in rows]
+        tagged = {eid for (eid,) in db.query(EntryTag.entry_id).filter(EntryTag.entry_id.in_(ids)).distinct()}
+        typed_rows, tag_rows = [], []
+        for r in rows:
+            day = _parse_day(r.day)
+            typed_rows.append({"b_id": r.id, "b_day": day, "b_created": _parse_updated_at(r.updated_at, day)})
+            if r.id not in tagged:
+                tag_rows += [{"entry_id": r.id, "couple_id": r.couple_id, "tag": t} for t in dict.fromkeys(split_tags(r.tags_csv))]
+        db.execute(_TYPED_UPDATE, typed_rows)
+        if tag_rows: db.execute(insert(EntryTag), tag_rows)
+        db.commit()
+        migrated += len(rows)
@@ -1,6 +1,6 @@
 import os
 from sqlalchemy import (
-    Column, Integer, String, ForeignKey, Text, Index
+    Column, Integer, BigInteger, String, ForeignKey, Text, Index, Date, DateTime
 )
 from sqlalchemy.orm import relationship
 from .db import Base
@@ -16,6 +16,9 @@ def table_args(*constraints):
         return (*constraints, {"schema": DB_SCHEMA})
     return constraints
 
+def split_tags(csv: str): return [t for t in (csv or "").split(",") if t.strip()]
+def join_tags(tags: list[str]): return ",".join(list(dict.fromkeys([t.strip() for t in (tags or []) if t.strip()])))
+
 # CASAL
 class Couple(Base):
     __tablename__ = "couples"
@@ -48,6 +51,7 @@ class Entry(Base):
     # Mantendo sem UniqueConstraint para tentar permitir múltiplos (se o banco deixar)
     __table_args__ = table_args(
         Index("ix_entries_couple_day", "couple_id", "day"),
+        Index("ix_entries_couple_day_date", "couple_id", "day_date"),
     )
     id = Column(Integer, primary_key=True)
     couple_id = Column(Integer, ForeignKey(fk("couples"), ondelete="CASCADE"), nullable=False)
@@ -60,7 +64,47 @@ class Entry(Base):
     music = Column(String(200), default="")
     updated_at = Column(String(32), default="")
     tags_csv = Column(Text, default="")
+    # Colunas tipadas (preenchidas na escrita e pelo `python -m app.manage migrate-typed` nas antigas)
+    day_date = Column(Date, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=True)
     couple = relationship("Couple", back_populates="entries")
+    tag_links = relationship("EntryTag", back_populates="entry", cascade="all, delete-orphan")
+
+# TAGS NORMALIZADAS (uma linha por tag de cada entrada)
+class EntryTag(Base):
+    __tablename__ = "entry_tags"
+    __table_args__ = table_args(
+        Index("ix_entry_tags_couple_tag", "couple_id", "tag", "entry_id"),
+    )
+    entry_id = Column(Integer, ForeignKey(fk("entries"), ondelete="CASCADE"), primary_key=True)
+    tag = Column(String(32), primary_key=True)
+    couple_id = Column(Integer, ForeignKey(fk("couples"), ondelete="CASCADE"), nullable=False)
+    entry = relationship("Entry", back_populates="tag_links")
+
+# RESUMO DIÁRIO (mantido na escrita por summaries.py)
+class DaySummary(Base):
+    __tablename__ = "day_summaries"
+    __table_args__ = table_args(
+        Index("ix_day_summaries_couple_day", "couple_id", "day", unique=True),
+        Index("ix_day_summaries_couple_version", "couple_id", "version"),
+    )
+    id = Column(Integer, primary_key=True)
+    couple_id = Column(Integer, ForeignKey(fk("couples"), ondelete="CASCADE"), nullable=False)
+    day = Column(String(10), nullable=False)
+    me_count = Column(Integer, nullable=False, default=0)
+    par_count = Column(Integer, nullable=False, default=0)
+    tag_counts = Column(Text, default="{}")  # JSON: {"tag": quantidade}
+    last_updated = Column(String(32), default="")
+    # Carimbo (ms) trocado a cada escrita no dia: chave do cache de fragmentos da timeline
+    version = Column(BigInteger, default=0)
+
+# SESSÕES NO SERVIDOR (app/sessions.py; o cookie só leva o ID)
+class ServerSession(Base):
+    __tablename__ = "sessions"
+    __table_args__ = table_args(Index("ix_sessions_expires_at", "expires_at"))
+    id = Column(String(64), primary_key=True)  # sha256 do ID que vai no cookie
+    data = Column(Text, nullable=False, default="{}")
+    expires_at = Column(BigInteger, nullable=False)  # epoch em segundos
 
 # EXTRAS
 class SpecialDate(Base):
@@ -76,7 +120,10 @@ class SpecialDate(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
-    __table_args__ = table_args(Index("ix_notifications_couple_id", "couple_id"))
+    __table_args__ = table_args(
+        Index("ix_notifications_couple_id", "couple_id"),
+        Index("ix_notifications_couple_event", "couple_id", "id"),  # reposição do /events
+    )
     id = Column(Integer, primary_key=True)
     couple_id = Column(Integer, ForeignKey(fk("couples"), ondelete="CASCADE"), nullable=False)
     created_at = Column(String(20), nullable=False)
@@ -0,0 +1,215 @@
+"""Instrumentação de desempenho (opcional).
+
+PERF_METRICS=1 liga o middleware: cada request ganha um header Server-Timing com o
+tempo gasto no banco, nos templates e no resto do Python, e os agregados por rota
+ficam em /metrics (formato texto do Prometheus, junto com o estado do pool).
+METRICS_TOKEN, se definido, passa a ser exigido como "Authorization: Bearer".
+
+SLOW_QUERY_MS=<n> registra no log "duo.perf" toda consulta acima de n ms, com os
+parâmetros trocados pelo tipo (nada do diário vai para o log). Funciona com ou sem
+PERF_METRICS.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from jinja2 import Template
+from sqlalchemy import event
+
+log = logging.getLogger("duo.perf")
+
+PERF_METRICS = os.getenv("PERF_METRICS", "").strip().lower() in ("1", "true", "yes")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# Mesma consulta (mesmo SQL) repetida a partir de N vezes num request = suspeita de N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RequestStats:
+    """Acumulado de um request; os eventos do engine e dos templates somam aqui."""
+    __slots__ = ("db", "render", "queries", "statements")
+
+    def __init__(self):
+        self.db = 0.0
+        self.render = 0.0
+        self.queries = 0
+        self.statements = Counter()
+
+    def n_plus_one(self) -> list[tuple[str, int]]:
+        return [(sql, n) for sql, n in self.statements.items() if n >= N_PLUS_ONE_THRESHOLD]
+
+
+# O threadpool do Starlette e o greenlet do modo async copiam o contexto, então o
+# objeto é o mesmo em todos os passos do request
+_current: ContextVar[RequestStats | None] = ContextVar("duo_request_stats", default=None)
+
+
+# =====================================================
+# BANCO
+# =====================================================
+def redact(params):
+    """Troca cada valor pelo nome do tipo; executemany vira o primeiro lote + quantidade."""
+    if isinstance(params, dict): return {k: f"<{type(v).__name__}>" for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        if params and isinstance(params[0], (dict, list, tuple)):
+            return [redact(params[0]), f"... x{len(params)}"] if len(params) > 1 else [redact(params[0])]
+        return [f"<{type(v).__name__}>" for v in params]
+    return "<redacted>"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("duo_perf_t0", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["duo_perf_t0"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.db += elapsed
+        stats.queries += 1
+        stats.statements[statement] += 1
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        metrics.inc("duo_slow_queries_total", {})
+        log.warning("consulta lenta (%.1f ms): %s | params=%s", elapsed * 1000, " ".join(statement.split()), redact(parameters))
+
+
+def _handle_error(exception_context):
+    # Consulta que falhou não passa pelo after_cursor_execute
+    stack = exception_context.connection.info.get("duo_perf_t0") if exception_context.connection is not None else None
+    if stack: stack.pop()
+
+
+def instrument_engine(sync_engine):
+    if not (PERF_METRICS or SLOW_QUERY_MS): return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+# =====================================================
+# TEMPLATES
+# =====================================================
+class TimedTemplate(Template):
+    """Template do Jinja que soma o tempo de render no request atual."""
+
+    def render(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None: return super().render(*args, **kwargs)
+        t0 = time.perf_counter()
+        try: return super().render(*args, **kwargs)
+        finally: stats.render += time.perf_counter() - t0
+
+
+# =====================================================
+# MÉTRICAS (texto do Prometheus, sem dependência)
+# =====================================================
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}    # (nome, labels) -> valor
+        self.histograms = {}  # labels -> [contagens por bucket..., soma, total]
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock: self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, labels: dict, seconds: float):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            h = self.histograms.setdefault(key, [0] * len(DURATION_BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound: h[i] += 1
+            h[-2] += seconds; h[-1] += 1
+
+    def render(self, pools: dict) -> str:
+        fmt = lambda labels: "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+        lines, typed = [], set()
+        def declare(name, kind):
+            if name not in typed: typed.add(name); lines.append(f"# TYPE {name} {kind}")
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                declare(name, "counter")
+                lines.append(f"{name}{fmt(labels)} {value:g}")
+            if self.histograms: declare("duo_http_request_duration_seconds", "histogram")
+            for labels, h in sorted(self.histograms.items()):
+                for i, bound in enumerate(DURATION_BUCKETS):
+                    lines.append(f"duo_http_request_duration_seconds_bucket{fmt(labels + (('le', bound),))} {h[i]}")
+                lines.append(f"duo_http_request_duration_seconds_bucket{fmt(labels + (('le', '+Inf'),))} {h[-1]}")
+                lines.append(f"duo_http_request_duration_seconds_sum{fmt(labels)} {h[-2]:.6f}")
+                lines.append(f"duo_http_request_duration_seconds_count{fmt(labels)} {h[-1]}")
+        for engine_name, snap in sorted(pools.items()):
+            for stat, value in sorted(snap.items()):
+                if not isinstance(value, (int, float)): continue
+                declare(f"duo_db_pool_{stat}", "gauge")
+                lines.append(f'duo_db_pool_{stat}{{engine="{engine_name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# =====================================================
+# MIDDLEWARE
+# =====================================================
+_route_labels = {}
+
+def route_label(scope) -> str:
+    """Caminho da rota (ex.: /delete_entry/{entry_id}) para não explodir a cardinalidade."""
+    route = scope.get("route")
+    if route is not None: return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is None: return "unmatched"
+    label = _route_labels.get(id(endpoint))
+    if label is None:
+        for r in scope["app"].routes:
+            if getattr(r, "endpoint", None) is endpoint or getattr(r, "app", None) is endpoint:
+                label = r.path; break
+        _route_labels[id(endpoint)] = label = label or "unmatched"
+    return label
+
+
+class PerfMiddleware:
+    """ASGI puro (não bufferiza o corpo): mede o request e escreve o Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = _current.set(stats)
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                total = (time.perf_counter() - t0) * 1000
+                db, render = stats.db * 1000, stats.render * 1000
+                timing = (f'db;dur={db:.1f};desc="{stats.queries} queries", render;dur={render:.1f}, '
+                          f'python;dur={max(total - db - render, 0):.1f}, total;dur={total:.1f}')
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            self.record(scope, stats, time.perf_counter() - t0, status[0])
+
+    def record(self, scope, stats: RequestStats, seconds: float, status: int):
+        route = route_label(scope)
+        labels = {"route": route}
+        metrics.inc("duo_http_requests_total", {"route": route, "method": scope["method"], "status": status})
+        metrics.observe(labels, seconds)
+        metrics.inc("duo_db_queries_total", labels, stats.queries)
+        metrics.inc("duo_phase_seconds_total", {"route": route, "phase": "db"}, stats.db)
+        metrics.inc("duo_phase_seconds_total", {"route": route, "phase": "render"}, stats.render)
+        metrics.inc("duo_phase_seconds_total", {"route": route, "phase": "python"}, max(seconds - stats.db - stats.render, 0))
+        for sql, n in stats.n_plus_one():
+            metrics.inc("duo_n_plus_one_total", labels)
+            log.warning("possível N+1 em %s %s: %d execuções de %s", scope["method"], route, n, " ".join(sql.split())[:200])
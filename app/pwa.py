@@ -0,0 +1,47 @@
+"""Manifesto de precache do service worker.
+
+`python -m app.manage build-sw` grava static/js/precache-manifest.js com as URLs
+(versionadas) que o sw.js baixa na instalação. Rodar no build do deploy; se o
+arquivo não existir ou for de outro build, o app gera de novo no startup.
+"""
+import json
+import os
+
+from .assets import STATIC_DIR, static_url, build_id
+
+PRECACHE_FILE = os.path.join(STATIC_DIR, "js", "precache-manifest.js")
+
+# Casca offline renderizada pelo app (a rota /offline) + assets estáticos do PWA
+SHELL_URLS = ["/offline"]
+STATIC_ASSETS = ["css/style.css", "manifest.json"]
+ICONS_DIR = os.path.join(STATIC_DIR, "icons")
+
+
+def precache_urls() -> list[str]:
+    assets = list(STATIC_ASSETS)
+    if os.path.isdir(ICONS_DIR):
+        assets += [f"icons/{name}" for name in sorted(os.listdir(ICONS_DIR))]
+    return SHELL_URLS + [static_url(a) for a in assets]
+
+
+def write_precache_manifest(path: str = PRECACHE_FILE) -> dict:
+    manifest = {"version": build_id(), "urls": precache_urls()}
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("// Gerado por `python -m app.manage build-sw`; não editar.\n")
+        f.write(f"self.DUO_PRECACHE = {json.dumps(manifest, indent=2)};\n")
+    return manifest
+
+
+def manifest_version(path: str = PRECACHE_FILE) -> str | None:
+    """`version` do manifesto gravado (None se não existe ou não dá para ler)."""
+    try:
+        with open(path, encoding="utf-8") as f: body = f.read()
+        return json.loads(body.split("=", 1)[1].strip().rstrip(";"))["version"]
+    except (OSError, IndexError, ValueError, KeyError, TypeError):
+        return None
+
+
+def ensure_precache_manifest():
+    # Checkout persistente: um style.css editado muda o build_id e o manifesto velho
+    # precacharia a URL ?v= antiga sob o nome de cache antigo
+    if manifest_version() != build_id(): write_precache_manifest()
@@ -0,0 +1,202 @@
+"""Busca no diário do casal (/search).
+
+Índice lateral, atualizado junto com cada escrita:
+  - SQLite: tabela virtual FTS5 `entries_fts` (rowid = id da entrada), ranking bm25;
+  - Postgres: tabela `entry_search` com tsvector + índice GIN, ranking ts_rank.
+
+O texto entra no índice já normalizado aqui em Python (minúsculas, sem acento,
+sem stopwords e com um stemmer leve de português), então os dois bancos usam só o
+tokenizador simples e a consulta passa pela mesma normalização. Cada termo vai
+prefixado com o casal ("c12xcinem"), então uma busca só percorre as postings do
+próprio casal, por maior que seja a tabela.
+
+Ranking por relevância nas SEARCH_RANK_WINDOW ocorrências mais recentes; se houver
+mais que isso, as mais antigas vêm depois, por data. Assim uma palavra que aparece em
+metade do diário não obriga a pontuar 25 mil linhas a cada página.
+
+Entradas antigas entram com `python -m app.manage rebuild-search`.
+"""
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .models import Entry, DB_SCHEMA
+
+SEARCH_FIELDS = ("mood", "moment_special", "love_action", "character", "music")
+SEARCH_PAGE_SIZE = 20
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "1000"))
+_PREFIX = f"{DB_SCHEMA}." if DB_SCHEMA else ""
+
+STOPWORDS = set("""
+a ao aos as ate com como da das de dela dele deles do dos e ela elas ele eles em entre era essa esse
+esta este eu foi ha isso ja lhe mais mas me mesmo meu minha muito na nas nem no nos nossa nosso num
+numa o os ou para pela pelas pelo pelos por qual quando que se sem seu sua tambem te teu tu tua um
+uma voce voces so ta to
+""".split())
+
+# Stemmer leve (inspirado no RSLP): plural, diminutivo/superlativo, advérbio, verbo, vogal final.
+# Não precisa acertar a raiz "de verdade", só mapear variações para a mesma forma nos dois lados.
+_RULES = (  # (sufixos, troca, tamanho mínimo do que sobra)
+    (("coes", "cao"), "cao", 3), (("oes", "aes", "aos"), "ao", 3), (("ais",), "al", 3), (("eis",), "el", 3), (("ois",), "ol", 3),
+    (("ns",), "m", 3), (("res", "zes"), "r", 3),
+    (("zinhos", "zinhas", "zinho", "zinha", "inhos", "inhas", "inho", "inha", "issimos", "issimas", "issimo", "issima"), "", 4),
+    (("amente", "mente"), "", 4),
+    (("ando", "endo", "indo", "amos", "emos", "imos", "aram", "eram", "iram", "avam", "ava", "ar", "er", "ir", "ou", "ei"), "", 3),
+    (("s",), "", 3), (("a", "o", "e"), "", 3),
+)
+
+
+def fold(value: str) -> str:
+    """Minúsculas e sem acento ("Coração" -> "coracao")."""
+    nfkd = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in nfkd if not unicodedata.combining(c)).lower()
+
+
+@lru_cache(maxsize=50000)  # vocabulário é pequeno: no rebuild/importação quase tudo é repetido
+def stem(word: str) -> str:
+    for suffixes, replacement, min_len in _RULES:
+        for suffix in suffixes:
+            if word.endswith(suffix) and len(word) - len(suffix) + len(replacement) >= min_len:
+                word = word[: len(word) - len(suffix)] + replacement
+                break
+    return word
+
+
+def terms(value: str) -> list[str]:
+    return [stem(w) for w in re.findall(r"[a-z0-9]+", fold(value)) if w not in STOPWORDS and len(w) > 1]
+
+
+def document(couple_id: int, *values: str) -> str:
+    return " ".join(f"c{couple_id}x{t}" for t in terms(" ".join(v or "" for v in values)))
+
+
+# =====================================================
+# ESQUEMA
+# =====================================================
+_backend = {"name": None}
+
+
+def ensure_search_schema(engine):
+    """Cria o índice lateral do backend. SQLite compilado sem FTS5 deixa a busca desligada ("off")."""
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {_PREFIX}entry_search ("
+                f"entry_id integer PRIMARY KEY REFERENCES {_PREFIX}entries(id) ON DELETE CASCADE, doc tsvector NOT NULL)"
+            ))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_entry_search_doc ON {_PREFIX}entry_search USING GIN (doc)"))
+            _backend["name"] = "postgres"
+            return
+        try:
+            conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(body, tokenize='unicode61')"))
+            _backend["name"] = "fts5"
+        except OperationalError:
+            _backend["name"] = "off"
+
+
+def search_backend(db: Session) -> str:
+    if _backend["name"] is None: ensure_search_schema(db.get_bind())
+    return _backend["name"]
+
+
+# =====================================================
+# SINCRONIA (dentro da transação de save/delete)
+# =====================================================
+def index_entry(db: Session, entry: Entry):
+    backend = search_backend(db)
+    if backend == "off": return
+    db.flush()  # precisa do id
+    body = document(entry.couple_id, *(getattr(entry, f) for f in SEARCH_FIELDS))
+    if backend == "postgres":
+        db.execute(text(
+            f"INSERT INTO {_PREFIX}entry_search (entry_id, doc) VALUES (:id, to_tsvector('simple', :body)) "
+            "ON CONFLICT (entry_id) DO UPDATE SET doc = EXCLUDED.doc"
+        ), {"id": entry.id, "body": body})
+    else:
+        db.execute(text("DELETE FROM entries_fts WHERE rowid = :id"), {"id": entry.id})
+        db.execute(text("INSERT INTO entries_fts (rowid, body) VALUES (:id, :body)"), {"id": entry.id, "body": body})
+
+
+def unindex_entry(db: Session, entry_id: int):
+    backend = search_backend(db)
+    if backend == "postgres": db.execute(text(f"DELETE FROM {_PREFIX}entry_search WHERE entry_id = :id"), {"id": entry_id})
+    elif backend == "fts5": db.execute(text("DELETE FROM entries_fts WHERE rowid = :id"), {"id": entry_id})
+
+
+def unindex_couple(db: Session, couple_id: int):
+    """Tira do índice todas as entradas do casal. Chamar ANTES de apagar as entradas: o filtro passa por elas."""
+    backend = search_backend(db)
+    if backend == "postgres":
+        db.execute(text(f"DELETE FROM {_PREFIX}entry_search WHERE entry_id IN (SELECT id FROM {_PREFIX}entries WHERE couple_id = :c)"), {"c": couple_id})
+    elif backend == "fts5":
+        db.execute(text("DELETE FROM entries_fts WHERE rowid IN (SELECT id FROM entries WHERE couple_id = :c)"), {"c": couple_id})
+
+
+def rebuild_search(db: Session, couple_id: int | None = None, batch_size: int = 1000) -> int:
+    """Refaz o índice (de um casal ou de todos) em lotes com executemany. Devolve quantas entradas indexou."""
+    backend = search_backend(db)
+    if backend == "off": return 0
+    if backend == "postgres":
+        clear = f"DELETE FROM {_PREFIX}entry_search" + (f" WHERE entry_id IN (SELECT id FROM {_PREFIX}entries WHERE couple_id = :c)" if couple_id else "")
+        insert = f"INSERT INTO {_PREFIX}entry_search (entry_id, doc) VALUES (:id, to_tsvector('simple', :body))"
+    else:
+        clear = "DELETE FROM entries_fts" + (f" WHERE rowid IN (SELECT id FROM entries WHERE couple_id = :c)" if couple_id else "")
+        insert = "INSERT INTO entries_fts (rowid, body) VALUES (:id, :body)"
+    db.execute(text(clear), {"c": couple_id} if couple_id else {})
+
+    q = db.query(Entry.id, Entry.couple_id, *(getattr(Entry, f) for f in SEARCH_FIELDS))
+    if couple_id: q = q.filter(Entry.couple_id == couple_id)
+    done, batch = 0, []
+    for row in q.order_by(Entry.id).yield_per(batch_size):
+        batch.append({"id": row.id, "body": document(row.couple_id, *row[2:])})
+        if len(batch) >= batch_size:
+            db.execute(text(insert), batch); done += len(batch); batch = []
+    if batch: db.execute(text(insert), batch); done += len(batch)
+    db.commit()
+    return done
+
+
+# =====================================================
+# CONSULTA
+# =====================================================
+def _match_ids(db: Session, backend: str, couple_id: int, words: list[str], ranked: bool, limit: int, offset: int) -> list[int]:
+    """ranked=True: as SEARCH_RANK_WINDOW mais recentes, por relevância; False: todas, por recência."""
+    tokens = [f"c{couple_id}x{w}" for w in words]
+    if backend == "fts5":
+        match = " ".join(t + "*" for t in tokens)
+        recent = "SELECT rowid, bm25(entries_fts) AS score FROM entries_fts WHERE entries_fts MATCH :m ORDER BY rowid DESC"
+        sql = f"SELECT rowid FROM ({recent} LIMIT :w) ORDER BY score, rowid DESC" if ranked else recent
+        params = {"m": match}
+    else:
+        recent = f"SELECT entry_id, doc FROM {_PREFIX}entry_search WHERE doc @@ to_tsquery('simple', :q) ORDER BY entry_id DESC"
+        sql = (f"SELECT entry_id FROM ({recent} LIMIT :w) s ORDER BY ts_rank(doc, to_tsquery('simple', :q)) DESC, entry_id DESC"
+               if ranked else f"SELECT entry_id FROM ({recent}) s")
+        params = {"q": " & ".join(t + ":*" for t in tokens)}
+    rows = db.execute(text(f"{sql} LIMIT :l OFFSET :o"), {**params, "w": SEARCH_RANK_WINDOW, "l": limit, "o": offset})
+    return [r[0] for r in rows]
+
+
+def search_entries(db: Session, couple_id: int, query: str, page: int = 1, page_size: int = SEARCH_PAGE_SIZE):
+    """Entradas do casal que batem com `query`, mais relevantes primeiro. Devolve (entradas, tem_próxima)."""
+    words = list(dict.fromkeys(terms(query)))[:8]
+    backend = search_backend(db)
+    if not words or backend == "off": return [], False
+    start, stop = (max(page, 1) - 1) * page_size, max(page, 1) * page_size + 1  # +1 para saber se há próxima
+
+    window = SEARCH_RANK_WINDOW
+    ids = _match_ids(db, backend, couple_id, words, True, max(min(stop, window) - start, 0), start) if start < window else []
+    if stop > window:
+        # Passou da janela ranqueada: continua pelas mais antigas, em ordem de data
+        tail_start = max(start, window)
+        ids += _match_ids(db, backend, couple_id, words, False, stop - tail_start, tail_start)
+
+    has_next = len(ids) > page_size
+    ids = ids[:page_size]
+    if not ids: return [], has_next
+    rows = {e.id: e for e in db.query(Entry).filter(Entry.couple_id == couple_id, Entry.id.in_(ids))}
+    return [rows[i] for i in ids if i in rows], has_next
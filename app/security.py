@@ -1,8 +1,26 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 from passlib.context import CryptContext
 from passlib.exc import UnknownHashError
 
+# Custo do pbkdf2 por ambiente (dev/testes podem baixar; produção sobe com o tempo).
+# min_rounds igual ao padrão faz hashes antigos mais fracos aparecerem em needs_update.
+PBKDF2_ROUNDS = int(os.getenv("PBKDF2_ROUNDS", "29000"))
+
+# Processos dedicados ao hash (0 = usa threads, útil em testes) e quantos hashes
+# podem estar na fila antes de recusarmos na hora em vez de empilhar logins
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "32"))
+
 # MUDANÇA: Usando pbkdf2_sha256 que não precisa de instalação externa
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"], deprecated="auto",
+    pbkdf2_sha256__default_rounds=PBKDF2_ROUNDS, pbkdf2_sha256__min_rounds=PBKDF2_ROUNDS,
+)
 
 def verify_password(plain_password, hashed_password):
     """Verifica se a senha digitada bate com o hash salvo."""
@@ -16,3 +34,60 @@ def verify_password(plain_password, hashed_password):
 def hash_password(password):
     """Transforma a senha em um hash seguro."""
     return pwd_context.hash(password)
+
+def _verify_and_check(plain_password, hashed_password):
+    """(senha confere?, hash precisa ser refeito com os parâmetros atuais?)"""
+    ok = verify_password(plain_password, hashed_password)
+    return ok, ok and pwd_context.needs_update(hashed_password)
+
+# =====================================================
+# POOL DE HASH (fora do event loop e do GIL do worker)
+# =====================================================
+class HashingBusy(Exception):
+    """A fila de hashes está cheia; a rota responde 503 na hora."""
+
+_executor = None
+_pending = 0
+_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            if HASH_WORKERS > 0:
+                # spawn: o worker do uvicorn tem threads, então nada de fork
+                _executor = ProcessPoolExecutor(HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _executor = ThreadPoolExecutor(max(1, os.cpu_count() or 1), thread_name_prefix="hash")
+        return _executor
+
+def _release(_future):
+    global _pending
+    with _lock: _pending -= 1
+
+async def _submit(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= HASH_MAX_PENDING: raise HashingBusy()
+        _pending += 1
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _release(None)
+        raise
+    future.add_done_callback(_release)
+    return await asyncio.wrap_future(future)
+
+async def verify_password_async(plain_password, hashed_password):
+    """Como verify_password, no pool. Devolve (confere?, precisa rehash?). Pode levantar HashingBusy."""
+    return await _submit(_verify_and_check, plain_password, hashed_password)
+
+async def hash_password_async(password):
+    """Como hash_password, no pool. Pode levantar HashingBusy."""
+    return await _submit(hash_password, password)
+
+def shutdown_hash_pool():
+    global _executor
+    with _lock:
+        if _executor is not None: _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
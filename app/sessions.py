@@ -0,0 +1,211 @@
+"""Sessão no servidor: o cookie leva só um ID opaco.
+
+SESSION_BACKEND escolhe onde os dados ficam:
+  - "db" (padrão): tabela `sessions`, serve para vários workers (com DB_ASYNC=1 vai
+    pelo engine async, no event loop; senão pelo threadpool);
+  - "memory": LRU no processo, para um worker só (reiniciar desloga todo mundo);
+  - "cookie": o SessionMiddleware assinado de antes (para voltar atrás sem deploy).
+
+A linha só é gravada quando a sessão muda (ou quando passou da metade da validade,
+para renovar), então request que só lê não escreve nada nem manda Set-Cookie.
+Expirados saem com `python -m app.manage sweep-sessions`.
+"""
+import hashlib
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import delete, select
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+from .db import DB_ASYNC, SessionLocal
+from .models import ServerSession
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "db").strip().lower()
+SESSION_MEMORY_SIZE = int(os.getenv("SESSION_MEMORY_SIZE", "10000"))
+# Assets não leem a sessão: não vale uma ida ao banco por arquivo
+SKIP_PREFIXES = ("/static/",)
+
+
+def _key(token: str) -> str:
+    # No banco fica o hash: um dump da tabela não dá para sequestrar sessões
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class MemorySessionStore:
+    """LRU com validade; a mais antiga sai quando enche."""
+    is_async_safe = True
+
+    def __init__(self, maxsize: int = SESSION_MEMORY_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # chave -> (json, expira_em)
+        self._lock = threading.Lock()
+
+    def load(self, token: str):
+        with self._lock:
+            hit = self._data.get(_key(token))
+            if hit is None: return None
+            if hit[1] <= time.time():
+                del self._data[_key(token)]; return None
+            self._data.move_to_end(_key(token))
+            return json.loads(hit[0]), hit[1]
+
+    def save(self, token: str, data: dict, expires_at: int):
+        with self._lock:
+            self._data[_key(token)] = (json.dumps(data), expires_at)
+            self._data.move_to_end(_key(token))
+            while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def delete(self, token: str):
+        with self._lock: self._data.pop(_key(token), None)
+
+    def sweep(self, batch_size: int = 1000) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._data.items() if exp <= now]
+            for k in expired: del self._data[k]
+        return len(expired)
+
+
+class DBSessionStore:
+    """Tabela `sessions` pelo engine síncrono (as chamadas vão para o threadpool)."""
+    is_async_safe = False
+
+    def load(self, token: str):
+        with SessionLocal() as db:
+            row = db.get(ServerSession, _key(token))
+            if row is None or row.expires_at <= time.time(): return None
+            return json.loads(row.data), row.expires_at
+
+    def save(self, token: str, data: dict, expires_at: int):
+        with SessionLocal() as db:
+            db.merge(ServerSession(id=_key(token), data=json.dumps(data), expires_at=expires_at))
+            db.commit()
+
+    def delete(self, token: str):
+        with SessionLocal() as db:
+            db.execute(delete(ServerSession).where(ServerSession.id == _key(token)))
+            db.commit()
+
+    def sweep(self, batch_size: int = 1000) -> int:
+        """Apaga as expiradas em lotes (uma transação curta por lote). Devolve quantas saíram."""
+        removed = 0
+        with SessionLocal() as db:
+            while True:
+                ids = db.scalars(select(ServerSession.id).where(ServerSession.expires_at <= int(time.time())).limit(batch_size)).all()
+                if not ids: break
+                db.execute(delete(ServerSession).where(ServerSession.id.in_(ids)))
+                db.commit()
+                removed += len(ids)
+        return removed
+
+
+class AsyncDBSessionStore:
+    """Mesma tabela pelo engine async (DB_ASYNC=1): roda no event loop, sem threadpool.
+
+    A limpeza dos expirados continua no DBSessionStore (comando síncrono do app.manage).
+    """
+    is_async_safe = True
+
+    def __init__(self):
+        from .db import AsyncSessionLocal  # só existe com DB_ASYNC=1
+        self.sessionmaker = AsyncSessionLocal
+
+    async def load(self, token: str):
+        async with self.sessionmaker() as db:
+            row = await db.get(ServerSession, _key(token))
+            if row is None or row.expires_at <= time.time(): return None
+            return json.loads(row.data), row.expires_at
+
+    async def save(self, token: str, data: dict, expires_at: int):
+        async with self.sessionmaker() as db:
+            await db.merge(ServerSession(id=_key(token), data=json.dumps(data), expires_at=expires_at))
+            await db.commit()
+
+    async def delete(self, token: str):
+        async with self.sessionmaker() as db:
+            await db.execute(delete(ServerSession).where(ServerSession.id == _key(token)))
+            await db.commit()
+
+
+def make_store(backend: str = SESSION_BACKEND):
+    if backend == "memory": return MemorySessionStore()
+    if backend == "db": return AsyncDBSessionStore() if DB_ASYNC else DBSessionStore()
+    raise ValueError(f"SESSION_BACKEND desconhecido: {backend}")
+
+
+class ServerSessionMiddleware:
+    """Substituto do SessionMiddleware do Starlette: mesmo `request.session`, dados no servidor.
+
+    Cookie assinado do formato antigo (anterior a esta mudança) é lido uma vez com
+    `legacy_secret` e convertido, para ninguém ser deslogado no deploy.
+    """
+
+    def __init__(self, app, store, session_cookie: str = "session", max_age: int = 14 * 24 * 60 * 60,
+                 same_site: str = "lax", https_only: bool = False, legacy_secret: str | None = None):
+        self.app = app
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.flags = f"httponly; samesite={same_site}" + ("; secure" if https_only else "")
+        self.legacy_signer = None
+        if legacy_secret:
+            import itsdangerous
+            self.legacy_signer = itsdangerous.TimestampSigner(str(legacy_secret))
+
+    async def _call(self, fn, *args):
+        if not self.store.is_async_safe: return await run_in_threadpool(fn, *args)
+        result = fn(*args)
+        return await result if inspect.isawaitable(result) else result
+
+    def _legacy(self, value: str):
+        import itsdangerous
+        from base64 import b64decode
+        try: return json.loads(b64decode(self.legacy_signer.unsign(value.encode(), max_age=self.max_age)))
+        except (itsdangerous.BadSignature, ValueError): return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"): return await self.app(scope, receive, send)
+        if scope["path"].startswith(SKIP_PREFIXES):
+            scope["session"] = {}
+            return await self.app(scope, receive, send)
+
+        token = cookie = HTTPConnection(scope).cookies.get(self.session_cookie)
+        data, expires_at, migrated = {}, 0, False
+        if token:
+            loaded = await self._call(self.store.load, token)
+            if loaded: data, expires_at = loaded
+            else:
+                legacy = self._legacy(token) if self.legacy_signer and "." in token else None
+                if legacy: data, migrated = legacy, True
+                token = None  # desconhecido/expirado: não reaproveita um ID que veio de fora
+        original = json.dumps(data, sort_keys=True)
+        scope["session"] = data
+
+        async def send_wrapper(message):
+            nonlocal token
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                changed = migrated or json.dumps(session, sort_keys=True) != original
+                headers = MutableHeaders(scope=message)
+                now = int(time.time())
+                if not session:
+                    if token: await self._call(self.store.delete, token)
+                    if cookie:
+                        headers.append("Set-Cookie", f"{self.session_cookie}=null; path=/; expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.flags}")
+                elif changed or expires_at - now < self.max_age // 2:
+                    if token and session.get("uid") != json.loads(original).get("uid"):
+                        # Login/troca de usuário ganha ID novo (evita fixação de sessão)
+                        await self._call(self.store.delete, token); token = None
+                    token = token or secrets.token_urlsafe(32)
+                    await self._call(self.store.save, token, session, now + self.max_age)
+                    headers.append("Set-Cookie", f"{self.session_cookie}={token}; path=/; Max-Age={self.max_age}; {self.flags}")
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
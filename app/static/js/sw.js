@@ -1,5 +1,194 @@
+// Service worker do Duo (servido em /sw.js para valer no site inteiro).
+//  - precache da casca (CSS, manifest, ícones, /offline) gerada pelo `app.manage build-sw`
+//  - network-first para / (o cache só entra sem rede) e stale-while-revalidate para /puxa-papo
+//  - POST que deu certo limpa o cache de páginas (a página seguinte já mostra a escrita)
+//  - /save_side feito offline vai para uma fila no IndexedDB e é reenviado depois
+importScripts("/static/js/precache-manifest.js");
+
+const PRECACHE = "duo-precache-" + self.DUO_PRECACHE.version;
+const PAGES = "duo-pages";
+const NETWORK_FIRST_PATHS = ["/"];
+const SWR_PATHS = ["/puxa-papo"];
+const QUEUE_DB = "duo-offline";
+const QUEUE_STORE = "save_side";
+const SYNC_TAG = "duo-save-queue";
 
 self.addEventListener("install", e => {
-  self.skipWaiting();
+  e.waitUntil(caches.open(PRECACHE).then(c => c.addAll(self.DUO_PRECACHE.urls)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener("activate", e => {
+  e.waitUntil((async () => {
+    for (const name of await caches.keys()) {
+      if (name.startsWith("duo-precache-") && name !== PRECACHE) await caches.delete(name);
+    }
+    await self.clients.claim();
+    await replayQueue();
+  })());
+});
+
+self.addEventListener("fetch", e => {
+  const req = e.request;
+  const url = new URL(req.url);
+  if (url.origin !== self.location.origin) return;
+
+  if (req.method === "POST" && url.pathname === "/save_side") {
+    e.respondWith(saveOrQueue(req));
+    return;
+  }
+  if (req.method === "POST") {
+    // /delete_entry, /pair/join, /import...: o 303 volta para uma página que mudou
+    e.respondWith(postAndInvalidate(req));
+    return;
+  }
+  if (req.method !== "GET") return;
+
+  if (url.pathname === "/logout") {
+    // Não deixa o diário de um usuário no cache para o próximo
+    e.waitUntil(Promise.all([caches.delete(PAGES), clearQueue()]));
+    return;
+  }
+  if (NETWORK_FIRST_PATHS.includes(url.pathname)) {
+    e.respondWith(networkFirst(req, url.pathname));
+    e.waitUntil(replayQueue());
+    return;
+  }
+  if (SWR_PATHS.includes(url.pathname)) {
+    e.respondWith(staleWhileRevalidate(e, req, url.pathname));
+    e.waitUntil(replayQueue());
+    return;
+  }
+  if (url.pathname.startsWith("/static/")) {
+    e.respondWith(caches.match(req).then(hit => hit || fetch(req)));
+  }
+});
+
+self.addEventListener("sync", e => {
+  if (e.tag === SYNC_TAG) e.waitUntil(replayQueue());
+});
+
+self.addEventListener("message", e => {
+  if (e.data === "replay") e.waitUntil(replayQueue());
 });
-self.addEventListener("fetch", e => {});
+
+// =====================================================
+// PÁGINAS
+// =====================================================
+async function networkFirst(req, key) {
+  // A timeline muda a cada save: com rede vai sempre ao servidor (o ETag evita baixar de novo).
+  // Chave só pelo caminho: "/?offline=1" usa a mesma cópia de "/"
+  const cache = await caches.open(PAGES);
+  try {
+    const res = await fetch(req);
+    if (res.ok && !res.redirected) await cache.put(key, res.clone());
+    else if (res.redirected) await cache.delete(key);
+    return res;
+  } catch (err) {
+    return (await cache.match(key)) || (await caches.match("/offline")) || Response.error();
+  }
+}
+
+function succeeded(res) {
+  // Formulário segue o redirect no navegador, então aqui o 303 chega como "opaqueredirect"
+  return res.type === "opaqueredirect" || (res.status >= 200 && res.status < 400);
+}
+
+async function postAndInvalidate(req) {
+  const res = await fetch(req);
+  if (succeeded(res)) await caches.delete(PAGES);
+  return res;
+}
+
+async function staleWhileRevalidate(event, req, key) {
+  const cache = await caches.open(PAGES);
+  const cached = await cache.match(key);
+  const network = fetch(req).then(async res => {
+    // Redirect (ex.: sessão expirou -> /login) não vai para o cache
+    if (res.ok && !res.redirected) await cache.put(key, res.clone());
+    else if (res.redirected) await cache.delete(key);
+    return res;
+  });
+  if (cached) {
+    event.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  try {
+    return await network;
+  } catch (err) {
+    return (await caches.match("/offline")) || Response.error();
+  }
+}
+
+// =====================================================
+// FILA OFFLINE DO /save_side
+// =====================================================
+function openQueue() {
+  return new Promise((resolve, reject) => {
+    const open = indexedDB.open(QUEUE_DB, 1);
+    open.onupgradeneeded = () => open.result.createObjectStore(QUEUE_STORE, { keyPath: "id", autoIncrement: true });
+    open.onsuccess = () => resolve(open.result);
+    open.onerror = () => reject(open.error);
+  });
+}
+
+async function withStore(mode, fn) {
+  const db = await openQueue();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(QUEUE_STORE, mode);
+    const result = fn(tx.objectStore(QUEUE_STORE));
+    tx.oncomplete = () => resolve(result && "result" in result ? result.result : undefined);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+async function saveOrQueue(req) {
+  const body = await req.clone().text();
+  let res;
+  try {
+    res = await fetch(req);
+  } catch (err) {
+    await withStore("readwrite", s => s.add({ body, contentType: req.headers.get("Content-Type"), queuedAt: Date.now() }));
+    if (self.registration.sync) {
+      try { await self.registration.sync.register(SYNC_TAG); } catch (e) {}
+    }
+    return Response.redirect("/?offline=1", 303);
+  }
+  if (succeeded(res)) await caches.delete(PAGES);
+  return res;
+}
+
+// Uma reposição por vez: "online" da página, o sync e a navegação para / chegam juntos
+// e cada um leria a fila inteira antes de apagar, postando o mesmo save duas ou três vezes
+let replaying = null;
+
+function replayQueue() {
+  if (!replaying) replaying = drainQueue().finally(() => { replaying = null; });
+  return replaying;
+}
+
+async function drainQueue() {
+  let items;
+  try { items = await withStore("readonly", s => s.getAll()); } catch (err) { return; }
+  let sent = 0;
+  for (const item of items || []) {
+    let res;
+    try {
+      res = await fetch("/save_side", {
+        method: "POST", body: item.body, credentials: "same-origin",
+        headers: { "Content-Type": item.contentType || "application/x-www-form-urlencoded" },
+      });
+    } catch (err) {
+      break;  // ainda offline
+    }
+    // Só sai da fila com o save confirmado: o 303 de sucesso termina em "/"; sessão
+    // expirada termina em /login (e 5xx é problema do servidor): tenta de novo depois
+    if (!res.ok || new URL(res.url).pathname !== "/") break;
+    await withStore("readwrite", s => s.delete(item.id));
+    sent++;
+  }
+  if (sent) await caches.delete(PAGES);
+}
+
+function clearQueue() {
+  return withStore("readwrite", s => s.clear()).catch(() => {});
+}
@@ -0,0 +1,119 @@
+import json
+import time
+
+from sqlalchemy import case, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import Entry, DaySummary, split_tags
+
+
+def _ensure_summary(db: Session, couple_id: int, day: str):
+    """Cria a linha do dia (zerada) se ainda não existir."""
+    if db.query(DaySummary.id).filter(DaySummary.couple_id == couple_id, DaySummary.day == day).first(): return
+    try:
+        with db.begin_nested():
+            db.add(DaySummary(couple_id=couple_id, day=day, me_count=0, par_count=0, tag_counts="{}", last_updated="", version=0))
+    except IntegrityError:
+        pass  # outro request criou a linha primeiro
+
+
+def _bump(db: Session, entry: Entry, delta: int):
+    """Contador e version num UPDATE só (conta feita pelo banco, sem ler-alterar-gravar em Python).
+
+    O UPDATE pega a trava de escrita (linha no Postgres, banco no SQLite) até o commit,
+    então um segundo save no mesmo dia espera e soma em cima do valor já gravado. O
+    version fica em ms e sempre crescente: dois writers nunca carimbam o mesmo valor, e o
+    maior version do casal também identifica a última escrita.
+    """
+    column = DaySummary.me_count if entry.author == "me" else DaySummary.par_count
+    now_ms = int(time.time() * 1000)
+    db.execute(
+        update(DaySummary)
+        .where(DaySummary.couple_id == entry.couple_id, DaySummary.day == entry.day)
+        .values({column: case((column + delta > 0, column + delta), else_=0),
+                 DaySummary.version: case((DaySummary.version + 1 > now_ms, DaySummary.version + 1), else_=now_ms)})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _refresh_tags(db: Session, couple_id: int, day: str):
+    """tag_counts e last_updated recalculados das entradas do dia (poucas linhas, pelo ix_entries_couple_day).
+
+    Roda depois do _bump, já com a trava de escrita: enxerga tudo que os outros saves commitaram.
+    """
+    tags, last = {}, ""
+    for tags_csv, updated_at in db.query(Entry.tags_csv, Entry.updated_at).filter(Entry.couple_id == couple_id, Entry.day == day):
+        for t in split_tags(tags_csv): tags[t] = tags.get(t, 0) + 1
+        last = max(last, updated_at or "")
+    db.execute(
+        update(DaySummary)
+        .where(DaySummary.couple_id == couple_id, DaySummary.day == day)
+        .values(tag_counts=json.dumps(tags), last_updated=last)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def add_entry(db: Session, entry: Entry):
+    """Soma uma entrada nova ao resumo do dia dela (chamar antes do commit do save)."""
+    db.flush()
+    _ensure_summary(db, entry.couple_id, entry.day)
+    _bump(db, entry, 1)
+    _refresh_tags(db, entry.couple_id, entry.day)
+
+
+def remove_entry(db: Session, entry: Entry):
+    """Desconta uma entrada apagada do resumo do dia (chamar depois do delete, antes do commit)."""
+    db.flush()
+    _ensure_summary(db, entry.couple_id, entry.day)
+    _bump(db, entry, -1)
+    _refresh_tags(db, entry.couple_id, entry.day)
+
+
+def day_summary(db: Session, couple_id: int, day: str) -> DaySummary | None:
+    return db.query(DaySummary).filter(DaySummary.couple_id == couple_id, DaySummary.day == day).first()
+
+
+def synergy(summary: DaySummary | None) -> tuple[bool, int]:
+    """(tem registro no dia?, sinergia em %): 100 se os dois escreveram, 50 se só um."""
+    if not summary or not (summary.me_count or summary.par_count): return False, 0
+    return True, 100 if summary.me_count and summary.par_count else 50
+
+
+def day_versions(db: Session, couple_id: int, days: list[str]) -> dict:
+    """{dia: version} dos dias pedidos (dias sem resumo ficam de fora)."""
+    if not days: return {}
+    return dict(db.query(DaySummary.day, DaySummary.version).filter(DaySummary.couple_id == couple_id, DaySummary.day.in_(days)))
+
+
+def couple_version(db: Session, couple_id: int) -> int:
+    """Maior version entre os dias do casal: muda a cada save/delete (base do ETag da home)."""
+    return db.query(func.max(DaySummary.version)).filter(DaySummary.couple_id == couple_id).scalar() or 0
+
+
+def rebuild_summaries(db: Session, couple_id: int | None = None, batch_size: int = 1000) -> int:
+    """Recalcula do zero os resumos (de um casal ou de todos). Devolve quantos dias foram gravados."""
+    couples = [couple_id] if couple_id else [cid for (cid,) in db.query(Entry.couple_id).distinct()]
+    written, version = 0, int(time.time() * 1000)
+    for cid in couples:
+        db.query(DaySummary).filter(DaySummary.couple_id == cid).delete(synchronize_session=False)
+        by_day = {}
+        rows = (
+            db.query(Entry.day, Entry.author, Entry.tags_csv, Entry.updated_at)
+            .filter(Entry.couple_id == cid)
+            .order_by(Entry.day)
+            .yield_per(batch_size)
+        )
+        for day, author, tags_csv, updated_at in rows:
+            s = by_day.setdefault(day, {"me_count": 0, "par_count": 0, "tags": {}, "last_updated": ""})
+            s["me_count" if author == "me" else "par_count"] += 1
+            for t in split_tags(tags_csv): s["tags"][t] = s["tags"].get(t, 0) + 1
+            s["last_updated"] = max(s["last_updated"], updated_at or "")
+        for day, s in by_day.items():
+            db.add(DaySummary(
+                couple_id=cid, day=day, me_count=s["me_count"], par_count=s["par_count"],
+                tag_counts=json.dumps(s["tags"]), last_updated=s["last_updated"], version=version,
+            ))
+        db.commit()
+        written += len(by_day)
+    return written
@@ -0,0 +1,13 @@
+"""Benchmarks do Duo.
+
+    python -m bench seed    --database-url sqlite:////tmp/duo-bench.db --sizes 10,1000,50000
+    python -m bench run     --database-url sqlite:////tmp/duo-bench.db -c 20 -n 200
+    python -m bench compare bench/results/antes.json bench/results/depois.json
+
+`seed` cria casais sintéticos (um por tamanho de diário), `run` dispara as rotas
+principais em processo (ASGI, sem rede) medindo p50/p95/p99, vazão e consultas SQL
+por request, e grava o resultado em JSON para comparar entre commits.
+
+Os scripts avulsos continuam aqui: `concurrency.py` (GET contra servidor externo,
+sync x async) e `login_hash.py` (custo do hash de senha no event loop).
+"""
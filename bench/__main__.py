@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import os
+
+from .run import ROUTES
+
+
+def main():
+    from . import __doc__ as usage
+    ap = argparse.ArgumentParser(prog="python -m bench", description=usage, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--database-url", help="banco do benchmark (senão usa DATABASE_URL)")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("seed", help="cria um casal sintético por tamanho de diário")
+    p.add_argument("--sizes", default="10,1000,10000,50000", help="entradas por casal, separadas por vírgula")
+    p.add_argument("--batch-size", type=int, default=2000)
+    p.add_argument("--rng-seed", type=int, default=42)
+
+    p = sub.add_parser("run", help="mede as rotas e grava o resultado em JSON")
+    p.add_argument("--sizes", help="só estes casais (padrão: todos os semeados)")
+    p.add_argument("--routes", default=",".join(ROUTES))
+    p.add_argument("-n", "--requests", type=int, default=200, help="requests por rota e casal")
+    p.add_argument("-c", "--concurrency", type=int, default=20)
+    p.add_argument("--warmup", type=int, default=5)
+    p.add_argument("--url", help="servidor externo em vez do app em processo (consultas via Server-Timing)")
+    p.add_argument("-o", "--out", help="arquivo JSON (padrão: bench/results/<data>-<commit>.json)")
+
+    p = sub.add_parser("compare", help="compara dois resultados")
+    p.add_argument("old"); p.add_argument("new")
+
+    args = ap.parse_args()
+    # Antes de importar o app: app.db lê DATABASE_URL na importação
+    if args.database_url: os.environ["DATABASE_URL"] = args.database_url
+    sizes = lambda raw: [int(s) for s in raw.split(",") if s.strip()] if raw else None
+
+    if args.command == "seed":
+        from .seed import seed
+        seed(sizes(args.sizes), batch_size=args.batch_size, rng_seed=args.rng_seed)
+    elif args.command == "run":
+        from .run import run, save
+        report = asyncio.run(run(sizes(args.sizes), [r for r in args.routes.split(",") if r], args.requests, args.concurrency, args.warmup, args.url))
+        print("resultado em", save(report, args.out))
+    elif args.command == "compare":
+        from .run import compare
+        compare(args.old, args.new)
+
+
+if __name__ == "__main__":  # o pool de hash (spawn) reimporta este módulo
+    main()
@@ -0,0 +1,79 @@
+"""Compara a vazão do caminho síncrono e do async sob concorrência.
+
+Sobe o app duas vezes e roda este script contra cada uma:
+
+    DB_ASYNC=0 uvicorn app.main:app --port 8000
+    python bench/concurrency.py --url http://127.0.0.1:8000 --email a@x --password 1234 -c 200
+
+    DB_ASYNC=1 uvicorn app.main:app --port 8001
+    python bench/concurrency.py --url http://127.0.0.1:8001 --email a@x --password 1234 -c 200
+
+Com concorrência acima do tamanho do threadpool do Starlette (40), o modo síncrono
+passa a enfileirar requests enquanto o async continua atendendo.
+"""
+import argparse
+import http.client
+import statistics
+import threading
+import time
+import urllib.parse
+
+
+def login(host, port, email, password):
+    conn = http.client.HTTPConnection(host, port)
+    body = urllib.parse.urlencode({"email": email, "password": password})
+    conn.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    res = conn.getresponse(); res.read()
+    cookie = res.getheader("set-cookie")
+    if res.status != 303 or not cookie: raise SystemExit(f"login falhou ({res.status})")
+    return cookie.split(";", 1)[0]
+
+
+def worker(host, port, path, cookie, deadline, latencies, errors, lock):
+    conn = http.client.HTTPConnection(host, port)
+    local, failed = [], 0
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path, headers={"Cookie": cookie})
+            res = conn.getresponse(); res.read()
+            if res.status >= 400: failed += 1
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close(); conn = http.client.HTTPConnection(host, port)
+            continue
+        local.append(time.perf_counter() - t0)
+    with lock:
+        latencies.extend(local)
+        errors[0] += failed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--path", default="/")
+    ap.add_argument("--email", required=True)
+    ap.add_argument("--password", required=True)
+    ap.add_argument("-c", "--concurrency", type=int, default=100)
+    ap.add_argument("-d", "--duration", type=float, default=15.0)
+    args = ap.parse_args()
+
+    url = urllib.parse.urlsplit(args.url)
+    cookie = login(url.hostname, url.port or 80, args.email, args.password)
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(url.hostname, url.port or 80, args.path, cookie, deadline, latencies, errors, lock))
+        for _ in range(args.concurrency)
+    ]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    if not latencies: raise SystemExit("nenhuma resposta")
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{len(latencies)} req em {args.duration:.0f}s  ({len(latencies) / args.duration:.1f} req/s), {errors[0]} erros")
+    print(f"p50 {q[49] * 1000:.1f} ms  p95 {q[94] * 1000:.1f} ms  p99 {q[98] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
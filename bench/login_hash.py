@@ -0,0 +1,70 @@
+"""Micro-benchmark do custo do pbkdf2 no login.
+
+Roda N verificações de senha com concorrência C em três modos e mede a vazão e o
+maior atraso do event loop (quanto os outros requests ficariam parados):
+
+    inline   verify_password direto no loop (o pior caso)
+    thread   no threadpool (como as rotas `def` antigas: ainda disputa o GIL)
+    process  no pool de processos do app.security (o caminho atual)
+
+    PBKDF2_ROUNDS=29000 HASH_WORKERS=2 python bench/login_hash.py -n 200 -c 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import security  # noqa: E402
+
+
+async def _loop_lag(stop: asyncio.Event, tick: float = 0.005):
+    worst = 0.0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(tick)
+        worst = max(worst, time.perf_counter() - t0 - tick)
+    return worst
+
+
+async def run(mode: str, n: int, concurrency: int, stored_hash: str):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            if mode == "inline": return security.verify_password("senha-do-bench", stored_hash)
+            if mode == "thread": return await asyncio.to_thread(security.verify_password, "senha-do-bench", stored_hash)
+            while True:
+                try: return (await security.verify_password_async("senha-do-bench", stored_hash))[0]
+                except security.HashingBusy: await asyncio.sleep(0.001)
+
+    if mode == "process": await security.verify_password_async("aquece", stored_hash)  # sobe os processos antes de medir
+    stop = asyncio.Event()
+    lag = asyncio.create_task(_loop_lag(stop))
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    assert all(results)
+    return n / elapsed, await lag
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-n", type=int, default=200, help="total de logins")
+    ap.add_argument("-c", "--concurrency", type=int, default=20)
+    ap.add_argument("--modes", default="inline,thread,process")
+    args = ap.parse_args()
+
+    stored_hash = security.hash_password("senha-do-bench")
+    print(f"pbkdf2_sha256 rounds={security.PBKDF2_ROUNDS} workers={security.HASH_WORKERS} max_pending={security.HASH_MAX_PENDING}")
+    for mode in args.modes.split(","):
+        rate, lag = asyncio.run(run(mode, args.n, args.concurrency, stored_hash))
+        print(f"{mode:>8}: {rate:7.1f} logins/s   pior atraso do loop {lag * 1000:7.1f} ms")
+    security.shutdown_hash_pool()
+
+
+if __name__ == "__main__":
+    main()
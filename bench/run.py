@@ -0,0 +1,211 @@
+"""Dispara as rotas principais contra casais semeados por `bench.seed` e mede cada uma.
+
+Por padrão o app roda no mesmo processo (httpx + ASGI, sem rede), o que permite
+contar as consultas SQL de cada request com eventos do engine. Com --url o alvo é
+um servidor de verdade; aí consultas e fases (db/render/python) vêm do header
+Server-Timing, se o servidor estiver com PERF_METRICS=1.
+"""
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import time
+from contextvars import ContextVar
+from datetime import datetime
+
+import httpx
+
+from .seed import BENCH_PASSWORD, TAGS, bench_email
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ROUTES = ["login", "home", "search", "puxa_papo_next", "save_side", "delete_entry"]
+SEARCH_QUERIES = ["cinema", "filmes juntos", "pôr do sol", "café da manhã", "abraço", "viagem parque"]
+
+# Lista [n] por request; os eventos do engine incrementam (threadpool e greenlet herdam o contexto)
+_queries: ContextVar[list | None] = ContextVar("bench_queries", default=None)
+
+
+def _count_query(*_):
+    counter = _queries.get()
+    if counter is not None: counter[0] += 1
+
+
+def instrument_engines():
+    from sqlalchemy import event
+    from app import db
+    engines = [db.engine] + ([db.async_engine.sync_engine] if db.DB_ASYNC else [])
+    for eng in engines: event.listen(eng, "before_cursor_execute", _count_query)
+
+
+def git_commit() -> str:
+    try: return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError): return "unknown"
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Percentil por interpolação linear (mesmo critério para qualquer n)."""
+    if len(sorted_values) == 1: return sorted_values[0]
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k); hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+# =====================================================
+# ROTAS (cada uma devolve o request da i-ésima chamada)
+# =====================================================
+def req_login(ctx, i):
+    side = "a" if i % 2 == 0 else "b"
+    return ctx["anon"], "POST", "/login", {"email": bench_email(ctx["size"], side), "password": BENCH_PASSWORD}
+
+def req_home(ctx, i): return ctx["client"], "GET", "/", None
+
+def req_search(ctx, i): return ctx["client"], "GET", f"/search?q={SEARCH_QUERIES[i % len(SEARCH_QUERIES)]}", None
+
+def req_puxa_papo_next(ctx, i):
+    return ctx["client"], "POST", "/puxa-papo/next", {"mode": ["divertidas", "romanticas", "profundas"][i % 3]}
+
+def req_save_side(ctx, i):
+    data = {"side": "self" if i % 2 == 0 else "partner", "mood": "bench", "moment_special": f"entrada de benchmark {i}", "tags": [TAGS[i % len(TAGS)]]}
+    return ctx["client"], "POST", "/save_side", data
+
+def req_delete_entry(ctx, i):
+    return ctx["client"], "POST", f"/delete_entry/{ctx['delete_ids'][i % len(ctx['delete_ids'])]}", None
+
+REQUESTS = {"login": req_login, "home": req_home, "search": req_search, "puxa_papo_next": req_puxa_papo_next, "save_side": req_save_side, "delete_entry": req_delete_entry}
+
+
+# =====================================================
+# EXECUÇÃO
+# =====================================================
+def server_timing(header: str | None) -> dict:
+    """Fases do header Server-Timing (app com PERF_METRICS=1): {"db": ms, ..., "queries": n}."""
+    phases = {}
+    for part in (header or "").split(","):
+        name, _, rest = part.strip().partition(";")
+        m = re.search(r"dur=([\d.]+)", rest)
+        if m: phases[name] = float(m.group(1))
+        m = re.search(r'desc="(\d+) queries"', rest)
+        if m: phases["queries"] = int(m.group(1))
+    return phases
+
+
+async def _one(ctx, route, i, samples, counted):
+    client, method, path, data = REQUESTS[route](ctx, i)
+    token = _queries.set([0]) if counted else None
+    t0 = time.perf_counter()
+    phases = {}
+    try:
+        res = await client.request(method, path, data=data)
+        ok = res.status_code < 400
+        phases = server_timing(res.headers.get("server-timing"))
+    except httpx.HTTPError:
+        ok = False
+    elapsed = time.perf_counter() - t0
+    queries = phases.get("queries")
+    if token is not None:
+        queries = _queries.get()[0]
+        _queries.reset(token)
+    samples.append((elapsed, ok, queries, phases))
+
+
+async def run_route(ctx, route, n, concurrency, warmup, counted):
+    for i in range(warmup): await _one(ctx, route, i, [], counted)
+    samples, sem = [], asyncio.Semaphore(concurrency)
+    async def bounded(i):
+        async with sem: await _one(ctx, route, i, samples, counted)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(n)))
+    wall = time.perf_counter() - t0
+
+    lat = sorted(s[0] * 1000 for s in samples)
+    queries = [s[2] for s in samples if s[2] is not None]
+    phases = [s[3] for s in samples if s[3]]
+    return {
+        "route": route, "couple_size": ctx["size"], "requests": n, "concurrency": concurrency,
+        "errors": sum(1 for s in samples if not s[1]),
+        "throughput_rps": round(n / wall, 1),
+        "p50_ms": round(percentile(lat, 50), 2), "p95_ms": round(percentile(lat, 95), 2), "p99_ms": round(percentile(lat, 99), 2),
+        "mean_ms": round(statistics.fmean(lat), 2),
+        "queries_mean": round(statistics.fmean(queries), 2) if queries else None,
+        "queries_max": max(queries) if queries else None,
+        "phase_ms": {k: round(statistics.fmean(p.get(k, 0.0) for p in phases), 2) for k in ("db", "render", "python")} if phases else None,
+    }
+
+
+def newest_entry_ids(couple_id: int, n: int) -> list[int]:
+    """Ids mais recentes do casal: depois de save_side, são justamente as entradas do benchmark."""
+    from app.db import SessionLocal
+    from app.models import Entry
+    with SessionLocal() as db:
+        return [eid for (eid,) in db.query(Entry.id).filter(Entry.couple_id == couple_id).order_by(Entry.id.desc()).limit(n)]
+
+
+def couples_by_size(sizes: list[int] | None) -> dict:
+    from app.db import SessionLocal
+    from app.models import Couple
+    with SessionLocal() as db:
+        found = {int(code[5:]): cid for cid, code in db.query(Couple.id, Couple.code).filter(Couple.code.like("bench%"))}
+    if sizes: found = {s: found[s] for s in sizes if s in found}
+    if not found: raise SystemExit("nenhum casal de benchmark no banco; rode `python -m bench seed` antes")
+    return dict(sorted(found.items()))
+
+
+async def run(sizes=None, routes=ROUTES, n=200, concurrency=20, warmup=5, url=None) -> dict:
+    from app.main import app
+    couples = couples_by_size(sizes)
+    counted = url is None  # em processo conta pelo engine; com --url só pelo Server-Timing
+    if counted: instrument_engines()
+
+    def new_client():
+        if url: return httpx.AsyncClient(base_url=url.rstrip("/"), timeout=60)
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    results = []
+    for size, couple_id in couples.items():
+        async with new_client() as client, new_client() as anon:
+            res = await client.post("/login", data={"email": bench_email(size, "a"), "password": BENCH_PASSWORD})
+            if res.status_code != 303: raise SystemExit(f"login do casal {size} falhou ({res.status_code})")
+            ctx = {"size": size, "couple_id": couple_id, "client": client, "anon": anon}
+            for route in routes:
+                if route == "delete_entry":
+                    ctx["delete_ids"] = newest_entry_ids(couple_id, n + warmup)
+                results.append(await run_route(ctx, route, n, concurrency, warmup, counted))
+                r = results[-1]
+                q = f"  {r['queries_mean']} consultas/req" if r["queries_mean"] is not None else ""
+                if r["phase_ms"]: q += "  " + " ".join(f"{k} {v:.1f}" for k, v in r["phase_ms"].items())
+                print(f"{size:>6} {route:<15} p50 {r['p50_ms']:>8.1f} ms  p95 {r['p95_ms']:>8.1f} ms  p99 {r['p99_ms']:>8.1f} ms  {r['throughput_rps']:>7.1f} req/s  {r['errors']} erros{q}")
+
+    from app.db import DATABASE_URL, DB_ASYNC
+    return {
+        "meta": {
+            "commit": git_commit(), "started_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "database": DATABASE_URL.split("://", 1)[0], "db_async": DB_ASYNC, "target": url or "in-process",
+            "requests_per_route": n, "concurrency": concurrency, "warmup": warmup,
+        },
+        "results": results,
+    }
+
+
+def save(report: dict, path: str | None = None) -> str:
+    if not path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{report['meta']['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f: json.dump(report, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def compare(old_path: str, new_path: str):
+    """Tabela de p95/vazão/consultas de dois resultados, rota a rota."""
+    with open(old_path, encoding="utf-8") as f: old = json.load(f)
+    with open(new_path, encoding="utf-8") as f: new = json.load(f)
+    before = {(r["route"], r["couple_size"]): r for r in old["results"]}
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    for r in new["results"]:
+        o = before.get((r["route"], r["couple_size"]))
+        if not o: continue
+        delta = (r["p95_ms"] - o["p95_ms"]) / o["p95_ms"] * 100 if o["p95_ms"] else 0.0
+        print(f"{r['couple_size']:>6} {r['route']:<15} p95 {o['p95_ms']:>8.1f} -> {r['p95_ms']:>8.1f} ms ({delta:+.0f}%)"
+              f"  {o['throughput_rps']:>7.1f} -> {r['throughput_rps']:>7.1f} req/s  consultas {o['queries_mean']} -> {r['queries_mean']}")
@@ -0,0 +1,89 @@
+"""Popula um banco (SQLite ou Postgres) com casais sintéticos para os benchmarks (com resumos e índice de busca)."""
+import random
+from datetime import date, datetime, time, timedelta
+
+BENCH_PASSWORD = "bench-1234"
+WORDS = (
+    "hoje a gente foi ao cinema jantar juntos rimos muito de tudo cansada mas feliz saudade do "
+    "fim de semana café da manhã na cama música nova viagem parque chuva abraço longo filme série "
+    "cozinhamos massa caminhada pôr do sol conversa boa surpresa flores bilhete carinho"
+).split()
+TAGS = ["hoje_tem", "quero_filme", "quero_massagem", "estressada", "saudades", "fofoca", "orgulho", "cansada"]
+
+
+def bench_email(size: int, side: str) -> str: return f"bench-{size}-{side}@duo.test"
+
+
+def _text(rng: random.Random, lo: int, hi: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(lo, hi)))
+
+
+def _entries(rng: random.Random, couple_id: int, total: int):
+    """Entradas espalhadas para trás a partir de hoje, 1 a 4 por dia, alternando os dois lados."""
+    day, made = date.today(), 0
+    while made < total:
+        for _ in range(min(rng.randint(1, 4), total - made)):
+            created = datetime.combine(day, time(rng.randint(7, 23), rng.randint(0, 59))).astimezone()
+            tags = rng.sample(TAGS, rng.choice([0, 0, 1, 2]))
+            yield {
+                "couple_id": couple_id, "day": day.isoformat(), "day_date": day, "created_at": created,
+                "author": rng.choice(["me", "par"]), "mood": _text(rng, 1, 4), "moment_special": _text(rng, 5, 60),
+                "love_action": _text(rng, 0, 12), "character": _text(rng, 0, 2), "music": _text(rng, 0, 3),
+                "updated_at": created.strftime("%d/%m %H:%M"), "tags_csv": ",".join(tags),
+            }
+            made += 1
+        day -= timedelta(days=1)
+
+
+def seed(sizes: list[int], batch_size: int = 2000, rng_seed: int = 42) -> dict:
+    """Cria um casal por tamanho (apaga o casal de mesmo tamanho se já existir). Devolve {tamanho: couple_id}."""
+    from sqlalchemy import insert, select
+
+    from app.db import Base, engine, SessionLocal
+    from app.migrate import ensure_schema
+    from app.models import Couple, User, Entry, EntryTag, DaySummary, split_tags
+    from app.security import hash_password
+    from app.summaries import rebuild_summaries
+    from app.search import ensure_search_schema, rebuild_search, unindex_couple
+
+    Base.metadata.create_all(bind=engine)
+    ensure_schema(engine)
+    ensure_search_schema(engine)
+    rng = random.Random(rng_seed)
+    password_hash = hash_password(BENCH_PASSWORD)
+    couples = {}
+    with SessionLocal() as db:
+        for size in sizes:
+            code = f"bench{size}"[:16]
+            old = db.query(Couple).filter(Couple.code == code).first()
+            if old:
+                # Em massa: o cascade do ORM carregaria as 50k entradas uma a uma
+                unindex_couple(db, old.id)
+                for model in (EntryTag, DaySummary, Entry, User):
+                    db.query(model).filter(model.couple_id == old.id).delete(synchronize_session=False)
+                db.query(Couple).filter(Couple.id == old.id).delete(synchronize_session=False)
+                db.commit()
+            couple = Couple(code=code)
+            db.add(couple); db.flush()
+            for side in ("a", "b"):
+                db.add(User(couple_id=couple.id, name=f"Bench {side.upper()}", email=bench_email(size, side), password_hash=password_hash))
+            db.commit()
+
+            batch = []
+            def flush(rows):
+                db.execute(insert(Entry), rows)
+                ids = db.execute(
+                    select(Entry.id, Entry.tags_csv).where(Entry.couple_id == couple.id).order_by(Entry.id.desc()).limit(len(rows))
+                ).all()
+                tag_rows = [{"entry_id": eid, "couple_id": couple.id, "tag": t} for eid, csv in ids for t in split_tags(csv)]
+                if tag_rows: db.execute(insert(EntryTag), tag_rows)
+                db.commit()
+            for row in _entries(rng, couple.id, size):
+                batch.append(row)
+                if len(batch) >= batch_size: flush(batch); batch = []
+            if batch: flush(batch)
+            rebuild_summaries(db, couple_id=couple.id)
+            rebuild_search(db, couple_id=couple.id)
+            couples[size] = couple.id
+            print(f"casal {couple.id}: {size} entradas")
+    return couples
@@ -0,0 +1,110 @@
+"""Teste headless do service worker contra um servidor local.
+
+Precisa de `pip install playwright && playwright install chromium` e de um usuário
+já pareado:
+
+    uvicorn app.main:app --port 8000
+    python scripts/sw_check.py --url http://127.0.0.1:8000 --email a@x --password 1234
+
+Confere: precache instalado, / abrindo do cache com a rede desligada, /save_side
+offline indo para a fila, a fila sobrevivendo a uma sessão expirada e sendo
+reenviada uma vez só quando a rede volta (com vários gatilhos ao mesmo tempo).
+"""
+import argparse
+import sys
+import time
+import uuid
+
+from playwright.sync_api import sync_playwright
+
+
+def check(ok, msg):
+    print(("ok   " if ok else "FAIL ") + msg)
+    if not ok: sys.exit(1)
+
+
+QUEUE_COUNT = """() => new Promise(res => {
+    const open = indexedDB.open("duo-offline", 1);
+    open.onsuccess = () => {
+        const req = open.result.transaction("save_side").objectStore("save_side").count();
+        req.onsuccess = () => res(req.result);
+    };
+})"""
+
+
+def login(page, base, email, password):
+    page.goto(base + "/login")
+    page.fill("input[name=email]", email)
+    page.fill("input[name=password]", password)
+    page.click("button[type=submit]")
+    page.wait_for_url(base + "/")
+
+
+def timeline(page) -> str:
+    return page.evaluate("fetch('/timeline?before=9999-12-31', {cache: 'no-store'}).then(r => r.text())")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--email", required=True)
+    ap.add_argument("--password", required=True)
+    ap.add_argument("--headed", action="store_true")
+    args = ap.parse_args()
+    base = args.url.rstrip("/")
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=not args.headed)
+        context = browser.new_context()
+        page = context.new_page()
+
+        login(page, base, args.email, args.password)
+
+        page.evaluate("navigator.serviceWorker.ready")
+        page.reload()  # a partir daqui a página é controlada pelo SW
+        check(page.evaluate("!!navigator.serviceWorker.controller"), "service worker controlando a página")
+        precached = page.evaluate("""async () => {
+            const name = (await caches.keys()).find(k => k.startsWith("duo-precache-"));
+            return name ? (await (await caches.open(name)).keys()).map(r => new URL(r.url).pathname) : [];
+        }""")
+        check("/offline" in precached and "/static/css/style.css" in precached, f"precache: {precached}")
+
+        context.set_offline(True)
+        page.reload()
+        check("Linha do Tempo" in page.content(), "/ abre do cache sem rede")
+
+        token = f"offline-{uuid.uuid4().hex[:8]}"
+        page.fill("textarea[name=moment_special]", token)
+        page.click(".card-me button[type=submit]")
+        page.wait_for_url("**/?offline=1")
+        queued = page.evaluate(QUEUE_COUNT)
+        check(queued == 1, f"/save_side offline foi para a fila ({queued})")
+
+        # Sessão expirada: o reenvio termina em /login e o item tem que continuar na fila
+        cookies = context.cookies()
+        context.clear_cookies()
+        context.set_offline(False)
+        page.evaluate("navigator.serviceWorker.controller.postMessage('replay')")
+        time.sleep(2)
+        queued = page.evaluate(QUEUE_COUNT)
+        check(queued == 1, f"fila mantida com a sessão expirada ({queued})")
+        context.add_cookies(cookies)
+
+        # Vários gatilhos juntos (mensagem da página, navegação para /): um post só
+        page.evaluate("navigator.serviceWorker.controller.postMessage('replay')")
+        page.evaluate("navigator.serviceWorker.controller.postMessage('replay')")
+        page.goto(base + "/")
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if page.evaluate(QUEUE_COUNT) == 0 and token in timeline(page): break
+            time.sleep(0.5)
+        time.sleep(1)  # dá tempo de um reenvio duplicado aparecer
+        copies = timeline(page).count(token)
+        check(copies == 1, f"fila reenviada uma vez só quando a rede voltou ({copies} cópias)")
+        check(page.evaluate(QUEUE_COUNT) == 0, "fila vazia depois do reenvio")
+
+        browser.close()
+
+
+if __name__ == "__main__":
+    main()